@@ -1,9 +1,12 @@
 import logging
+from collections.abc import AsyncIterator
 
+import orjson
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
-from services.ai import chat, detect_symbol
+from services.ai import chat, chat_stream, detect_symbol
 from services.fmp import fetch_batch_quotes
 
 logger = logging.getLogger(__name__)
@@ -24,8 +27,8 @@ class ChatResponse(BaseModel):
     reply: str
 
 
-@router.post("/chat", response_model=ChatResponse)
-async def ai_chat(req: ChatRequest) -> ChatResponse:
+async def _prepare(req: ChatRequest) -> tuple[list[dict[str, str]], str | None]:
+    """Validate the request and build (messages, live price context)."""
     if req.user_tier not in ("pro", "elite"):
         raise HTTPException(status_code=403, detail="AI chat requires Pro or Elite plan")
 
@@ -52,5 +55,32 @@ async def ai_chat(req: ChatRequest) -> ChatResponse:
         except Exception as exc:
             logger.warning("Price fetch for AI context failed (%s): %s", symbol, exc)
 
-    reply = chat(messages, price_context)
+    return messages, price_context
+
+
+@router.post("/chat", response_model=ChatResponse)
+async def ai_chat(req: ChatRequest) -> ChatResponse:
+    messages, price_context = await _prepare(req)
+    reply = await chat(messages, price_context)
     return ChatResponse(reply=reply)
+
+
+@router.post("/chat/stream")
+async def ai_chat_stream(req: ChatRequest) -> StreamingResponse:
+    """Server-Sent Events: one `data: {"delta": ...}` per chunk, then `data: [DONE]`."""
+    messages, price_context = await _prepare(req)
+
+    async def events() -> AsyncIterator[bytes]:
+        try:
+            async for delta in chat_stream(messages, price_context):
+                yield b"data: " + orjson.dumps({"delta": delta}) + b"\n\n"
+        except Exception as exc:
+            logger.error("AI chat stream error: %s", exc)
+            yield b"data: " + orjson.dumps({"error": "AI is temporarily unavailable"}) + b"\n\n"
+        yield b"data: [DONE]\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -9,6 +9,7 @@ from pydantic import BaseModel, Field
 from supabase import create_client
 
 from core.config import settings
+from services.alert_engine import invalidate_alert_cache
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/alerts", tags=["alerts"])
@@ -156,6 +157,7 @@ def create_alert(
         })
         .execute()
     )
+    invalidate_alert_cache()
 
     return AlertOut(**row.data[0])
 
@@ -176,3 +178,4 @@ def delete_alert(alert_id: str, authorization: str = Header(...)) -> None:
 
     if not result.data:
         raise HTTPException(status_code=404, detail="Alert not found")
+    invalidate_alert_cache()
@@ -2,13 +2,13 @@
 
 import logging
 
-import httpx
 from fastapi import APIRouter, Header, HTTPException
 from pydantic import BaseModel
 from supabase import create_client
 
 from api.alerts import _get_user_id
 from core.config import settings
+from services.telegram_service import get_bot
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/profile", tags=["profile"])
@@ -23,12 +23,6 @@ class LinkBody(BaseModel):
     whatsapp: str | None = None
 
 
-async def _send_telegram_message(chat_id: str, text: str) -> None:
-    url = f"https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}/sendMessage"
-    async with httpx.AsyncClient(timeout=8) as client:
-        await client.post(url, json={"chat_id": chat_id, "text": text, "parse_mode": "Markdown"})
-
-
 @router.post("/link")
 async def link_channels(body: LinkBody, authorization: str = Header(...)) -> dict:
     """Save Telegram ID and/or WhatsApp number from the dashboard settings page.
@@ -64,7 +58,7 @@ async def link_channels(body: LinkBody, authorization: str = Header(...)) -> dic
                 f"Plan: *{tier}*\n\n"
                 f"Use /menu to get started. Happy trading! 🚀"
             )
-            await _send_telegram_message(body.telegram_id, msg)
+            await get_bot().send_message(chat_id=body.telegram_id, text=msg, parse_mode="Markdown")
         except Exception as exc:
             logger.warning("Could not send Telegram link confirmation: %s", exc)
 
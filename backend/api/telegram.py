@@ -2,35 +2,39 @@
 
 import asyncio
 import logging
+from contextlib import asynccontextmanager
 from datetime import date, datetime, timezone
 from typing import Any
 
 import httpx
-from aiogram import Bot, Dispatcher
-from aiogram.types import (
-    CallbackQuery,
-    InlineKeyboardButton,
-    InlineKeyboardMarkup,
-    Update,
-)
-from fastapi import APIRouter, Request
-from supabase import create_client
+import orjson
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+from fastapi import APIRouter, BackgroundTasks, Request
 
 from core.config import settings
+from core.db import get_supabase
 from services.ai import chat as ai_chat, parse_reminder, detect_symbol
+from services.alert_engine import invalidate_alert_cache
 from services.fmp import fetch_batch_quotes
+from services.telegram_service import _is_parse_error, get_bot
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/telegram", tags=["telegram"])
 
-_dp = Dispatcher()
-_bot: Bot | None = None
+# Updates are handled after the webhook has already answered Telegram;
+# this caps how many are processed at once, the rest wait their turn.
+MAX_CONCURRENT_UPDATES = 200
+_update_sem = asyncio.Semaphore(MAX_CONCURRENT_UPDATES)
 
 # ── State machine ─────────────────────────────────────────────────────────────
 # {telegram_id: {"state": str, "data": dict}}
 _states: dict[str, dict] = {}
 _chat_history: dict[str, list[dict[str, str]]] = {}
 FREE_CHAT_LIMIT = 3
+TYPING_DELAY = 0.3    # seconds before showing "typing…"
+TYPING_REFRESH = 4.0  # seconds between chat-action refreshes
 
 
 def _get_state(tid: str) -> dict:
@@ -45,17 +49,34 @@ def _clear_state(tid: str) -> None:
     _states.pop(tid, None)
 
 
-def get_bot() -> Bot:
-    global _bot
-    if _bot is None:
-        _bot = Bot(token=settings.TELEGRAM_BOT_TOKEN)
-    return _bot
+async def _typing_loop(bot: Bot, chat_id: int) -> None:
+    await asyncio.sleep(TYPING_DELAY)
+    while True:
+        try:
+            await bot.send_chat_action(chat_id=chat_id, action="typing")
+        except Exception as exc:
+            logger.debug("send_chat_action failed for %s: %s", chat_id, exc)
+        await asyncio.sleep(TYPING_REFRESH)
+
+
+@asynccontextmanager
+async def _typing(bot: Bot, chat_id: int):
+    """Show "typing…" only if the wrapped work is slow, refreshing it until done.
+
+    Fast replies skip the extra Bot API call entirely; Telegram drops the
+    indicator after ~5 s, so slow ones get it re-sent every TYPING_REFRESH.
+    """
+    task = asyncio.create_task(_typing_loop(bot, chat_id))
+    try:
+        yield
+    finally:
+        task.cancel()
 
 
 # ── Supabase helpers ──────────────────────────────────────────────────────────
 
 def _db():
-    return create_client(settings.SUPABASE_URL, settings.SUPABASE_SERVICE_KEY)
+    return get_supabase()
 
 
 def _get_profile(telegram_id: str) -> dict | None:
@@ -122,6 +143,7 @@ def _create_alert(
             "pip_buffer": pip_buffer if pip_buffer is not None else 5.0,
             "zone_high": zone_high,
         }).execute()
+        invalidate_alert_cache()
         return True
     except Exception as e:
         logger.error("Create alert error: %s", e)
@@ -195,6 +217,7 @@ def _create_correlation_alert(user_id: str, sym1: str, sym2: str, zone_low: floa
             "zone_low": zone_low,
             "zone_high": zone_high,
         }).execute()
+        invalidate_alert_cache()
         return True
     except Exception as e:
         logger.error("Create correlation alert error: %s", e)
@@ -220,6 +243,7 @@ def _get_correlation_alerts(user_id: str) -> list[dict]:
 def _delete_correlation_alert(alert_id: str, user_id: str) -> bool:
     try:
         _db().table("correlation_alerts").delete().eq("id", alert_id).eq("user_id", user_id).execute()
+        invalidate_alert_cache()
         return True
     except Exception:
         return False
@@ -228,6 +252,7 @@ def _delete_correlation_alert(alert_id: str, user_id: str) -> bool:
 def _delete_alert(alert_id: str, user_id: str) -> bool:
     try:
         _db().table("alerts").delete().eq("id", alert_id).eq("user_id", user_id).execute()
+        invalidate_alert_cache()
         return True
     except Exception:
         return False
@@ -479,12 +504,10 @@ async def _require_linked(bot: Bot, chat_id: int, tid: str) -> dict | None:
 
 # ── Callback query handler ────────────────────────────────────────────────────
 
-async def _handle_callback(bot: Bot, cq: CallbackQuery) -> None:
-    chat_id = cq.message.chat.id
+async def _handle_callback(bot: Bot, callback_id: str, chat_id: int, data: str) -> None:
     tid = str(chat_id)
-    data = cq.data or ""
 
-    await bot.answer_callback_query(cq.id)
+    await bot.answer_callback_query(callback_id)
 
     # Main menu
     if data == "menu_main":
@@ -720,7 +743,6 @@ async def _handle_callback(bot: Bot, cq: CallbackQuery) -> None:
         profile = await _require_linked(bot, chat_id, tid)
         if not profile:
             return
-        await bot.send_chat_action(chat_id=chat_id, action="typing")
         try:
             groups = {
                 "Dollar Pairs 💵": ["EURUSD", "GBPUSD", "USDJPY", "USDCHF"],
@@ -728,7 +750,8 @@ async def _handle_callback(bot: Bot, cq: CallbackQuery) -> None:
                 "Risk-On 📈": ["GBPJPY", "AUDUSD", "BTCUSD", "ETHUSD"],
             }
             all_symbols = list({s for g in groups.values() for s in g})
-            quotes = await fetch_batch_quotes(all_symbols)
+            async with _typing(bot, chat_id):
+                quotes = await fetch_batch_quotes(all_symbols)
             tier = profile.get("tier", "free")
             group_items = list(groups.items()) if tier in ("pro", "elite") else list(groups.items())[:1]
             lines = ["📊 *Live Correlated Pairs*\n"]
@@ -1215,9 +1238,9 @@ async def _handle_text(bot: Bot, chat_id: int, text: str, first_name: str | None
         else:
             # Inline: /remind <natural language>
             reminder_text = parts[1]
-            await bot.send_chat_action(chat_id=chat_id, action="typing")
             now_utc = datetime.now(timezone.utc).isoformat()
-            parsed = await asyncio.to_thread(parse_reminder, reminder_text, now_utc)
+            async with _typing(bot, chat_id):
+                parsed = await parse_reminder(reminder_text, now_utc)
             if not parsed or not parsed.get("remind_at"):
                 await bot.send_message(
                     chat_id,
@@ -1251,9 +1274,9 @@ async def _handle_text(bot: Bot, chat_id: int, text: str, first_name: str | None
     # Custom reminder via AI parsing
     if s == "reminder_custom":
         user_id = d["user_id"]
-        await bot.send_chat_action(chat_id=chat_id, action="typing")
         now_utc = datetime.now(timezone.utc).isoformat()
-        parsed = await asyncio.to_thread(parse_reminder, text, now_utc)
+        async with _typing(bot, chat_id):
+            parsed = await parse_reminder(text, now_utc)
         if not parsed or not parsed.get("remind_at"):
             await bot.send_message(
                 chat_id,
@@ -1606,53 +1629,72 @@ async def _handle_text(bot: Bot, chat_id: int, text: str, first_name: str | None
 
     history.append({"role": "user", "content": text})
     _chat_history[tid] = history
-    await bot.send_chat_action(chat_id=chat_id, action="typing")
 
-    # Detect symbol → fetch live price → inject as context so AI gives relevant zones
-    price_context: str | None = None
-    symbol = detect_symbol(text)
-    if symbol:
+    async with _typing(bot, chat_id):
+        # Detect symbol → fetch live price → inject as context so AI gives relevant zones
+        price_context: str | None = None
+        symbol = detect_symbol(text)
+        if symbol:
+            try:
+                quotes = await fetch_batch_quotes([symbol])
+                q = quotes.get(symbol)
+                if q:
+                    price = q.get("price", 0)
+                    chg = q.get("changesPercentage", 0)
+                    price_context = (
+                        f"{symbol} live price: {price} ({chg:+.2f}% today)\n"
+                        f"Base ALL zones and levels on this exact current price."
+                    )
+            except Exception as exc:
+                logger.warning("Price fetch for AI context failed (%s): %s", symbol, exc)
+
         try:
-            quotes = await fetch_batch_quotes([symbol])
-            q = quotes.get(symbol)
-            if q:
-                price = q.get("price", 0)
-                chg = q.get("changesPercentage", 0)
-                price_context = (
-                    f"{symbol} live price: {price} ({chg:+.2f}% today)\n"
-                    f"Base ALL zones and levels on this exact current price."
-                )
+            reply = await ai_chat(history, price_context)
         except Exception as exc:
-            logger.warning("Price fetch for AI context failed (%s): %s", symbol, exc)
+            logger.error("AI chat error: %s", exc)
+            await bot.send_message(chat_id, "⚠️ AI is temporarily unavailable. Please try again shortly.")
+            return
 
+    history.append({"role": "assistant", "content": reply})
+    _chat_history[tid] = history[-20:]
     try:
-        reply = await asyncio.to_thread(ai_chat, history, price_context)
-        history.append({"role": "assistant", "content": reply})
-        _chat_history[tid] = history[-20:]
         await bot.send_message(chat_id, reply, parse_mode="Markdown")
-    except Exception as exc:
-        logger.error("AI chat error: %s", exc)
-        # Retry without Markdown parse mode in case of formatting issues
-        try:
-            await bot.send_message(chat_id, reply)
-        except Exception:
-            await bot.send_message(chat_id, "⚠️ AI is temporarily unavailable. Please try again shortly.")
+        return
+    except TelegramAPIError as exc:
+        if not _is_parse_error(exc):
+            logger.error("AI chat reply send failed for %s: %s", chat_id, exc)
+            return
+    # Retry without Markdown parse mode — the model's formatting didn't parse
+    try:
+        await bot.send_message(chat_id, reply)
+    except TelegramAPIError as exc:
+        logger.error("AI chat plain-text reply failed for %s: %s", chat_id, exc)
 
 
 # ── Webhook endpoint ──────────────────────────────────────────────────────────
 
+async def _process_update(bot: Bot, body: dict[str, Any]) -> None:
+    # Only chat id, text and callback data are used — read them from the raw
+    # update rather than validating the full aiogram Update model.
+    async with _update_sem:
+        try:
+            cq = body.get("callback_query")
+            if cq:
+                cq_message = cq.get("message")
+                if cq_message:
+                    await _handle_callback(bot, cq["id"], cq_message["chat"]["id"], cq.get("data") or "")
+            else:
+                message = body.get("message")
+                if message and message.get("text"):
+                    first_name = (message.get("from") or {}).get("first_name")
+                    await _handle_text(bot, message["chat"]["id"], message["text"], first_name)
+        except Exception as exc:
+            logger.error("Telegram update error: %s", exc, exc_info=True)
+
+
 @router.post("/webhook")
-async def telegram_webhook(request: Request) -> dict[str, Any]:
-    body = await request.json()
-    bot = get_bot()
-    update = Update.model_validate(body)
-
-    if update.callback_query:
-        await _handle_callback(bot, update.callback_query)
-    elif update.message and update.message.text:
-        from_user = update.message.from_user
-        first_name = from_user.first_name if from_user else None
-        await _handle_text(bot, update.message.chat.id, update.message.text, first_name)
-
-    await _dp.feed_update(bot=bot, update=update)
+async def telegram_webhook(request: Request, background_tasks: BackgroundTasks) -> dict[str, Any]:
+    """Acknowledge immediately — Telegram re-delivers updates on slow webhooks."""
+    body = orjson.loads(await request.body())
+    background_tasks.add_task(_process_update, get_bot(), body)
     return {"ok": True}
@@ -2,13 +2,18 @@
 
 import asyncio
 import logging
+from collections import OrderedDict, deque
+from collections.abc import Awaitable, Callable
 
+import orjson
+from cachetools import TTLCache
 from fastapi import APIRouter, Header, HTTPException, Request
 from fastapi.responses import PlainTextResponse
-from supabase import create_client
 
 from core.config import settings
+from core.db import get_supabase
 from services.ai import chat as ai_chat
+from services.alert_engine import invalidate_alert_cache
 from services.whatsapp_service import (
     send_button_message,
     send_list_message,
@@ -19,18 +24,36 @@ from services.whatsapp_service import (
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/whatsapp", tags=["whatsapp"])
 
+MAX_CONCURRENT_MESSAGES = 16
+_message_sem = asyncio.Semaphore(MAX_CONCURRENT_MESSAGES)
+_message_tasks: set[asyncio.Task] = set()
+
 # ── State machine ─────────────────────────────────────────────────────────────
-_states: dict[str, dict] = {}
-_chat_history: dict[str, list[dict[str, str]]] = {}
+# Both maps are LRU-bounded so phones that never come back age out
+MAX_SESSIONS = 10_000
+_states: OrderedDict[str, dict] = OrderedDict()
+_chat_history: OrderedDict[str, deque[dict[str, str]]] = OrderedDict()
 FREE_CHAT_LIMIT = 3
+CHAT_HISTORY_TURNS = 20
+
+
+def _remember(store: OrderedDict, phone: str, value) -> None:
+    store[phone] = value
+    store.move_to_end(phone)
+    if len(store) > MAX_SESSIONS:
+        store.popitem(last=False)
 
 
 def _get_state(phone: str) -> dict:
-    return _states.get(phone, {"state": "idle", "data": {}})
+    state = _states.get(phone)
+    if state is None:
+        return {"state": "idle", "data": {}}
+    _states.move_to_end(phone)
+    return state
 
 
 def _set_state(phone: str, state: str, data: dict | None = None) -> None:
-    _states[phone] = {"state": state, "data": data or {}}
+    _remember(_states, phone, {"state": state, "data": data or {}})
 
 
 def _clear_state(phone: str) -> None:
@@ -40,55 +63,31 @@ def _clear_state(phone: str) -> None:
 # ── Supabase helpers ──────────────────────────────────────────────────────────
 
 def _db():
-    return create_client(settings.SUPABASE_URL, settings.SUPABASE_SERVICE_KEY)
+    return get_supabase()
 
 
-def _get_profile(phone: str) -> dict | None:
-    try:
-        r = (
-            _db().table("profiles")
-            .select("*")
-            .eq("whatsapp", phone)
-            .maybe_single()
-            .execute()
-        )
-        return r.data
-    except Exception:
-        return None
+# Linked profiles by phone — tier/link changes show up within PROFILE_TTL
+PROFILE_TTL = 60
+_profile_cache: TTLCache[str, dict] = TTLCache(maxsize=10_000, ttl=PROFILE_TTL)
 
 
-def _get_alerts(user_id: str) -> list[dict]:
+async def _get_profile(phone: str) -> dict | None:
+    profile = _profile_cache.get(phone)
+    if profile is not None:
+        return profile
     try:
-        r = (
-            _db().table("alerts")
-            .select("*")
-            .eq("user_id", user_id)
-            .is_("triggered_at", "null")
-            .order("created_at", desc=True)
-            .execute()
-        )
-        return r.data or []
+        q = _db().table("profiles").select("*").eq("whatsapp", phone).maybe_single()
+        r = await asyncio.to_thread(q.execute)
     except Exception:
-        return []
-
-
-def _get_history(user_id: str, limit: int = 10) -> list[dict]:
-    try:
-        r = (
-            _db().table("alerts")
-            .select("*")
-            .eq("user_id", user_id)
-            .not_.is_("triggered_at", "null")
-            .order("triggered_at", desc=True)
-            .limit(limit)
-            .execute()
-        )
-        return r.data or []
-    except Exception:
-        return []
+        return None
+    # Only hits are cached so a freshly linked number is picked up immediately
+    if r and r.data:
+        _profile_cache[phone] = r.data
+        return r.data
+    return None
 
 
-def _create_alert(
+async def _create_alert(
     user_id: str,
     symbol: str,
     alert_type: str,
@@ -98,7 +97,7 @@ def _create_alert(
     zone_high: float | None = None,
 ) -> bool:
     try:
-        _db().table("alerts").insert({
+        q = _db().table("alerts").insert({
             "user_id": user_id,
             "symbol": symbol.upper(),
             "alert_type": alert_type,
@@ -106,104 +105,144 @@ def _create_alert(
             "direction": direction,
             "pip_buffer": pip_buffer,
             "zone_high": zone_high,
-        }).execute()
+        })
+        await asyncio.to_thread(q.execute)
+        invalidate_alert_cache()
         return True
     except Exception as e:
         logger.error("WA create alert error: %s", e)
         return False
 
 
-def _delete_alert(alert_id: str, user_id: str) -> bool:
+async def _delete_alert(alert_id: str, user_id: str) -> bool:
     try:
-        _db().table("alerts").delete().eq("id", alert_id).eq("user_id", user_id).execute()
+        q = _db().table("alerts").delete().eq("id", alert_id).eq("user_id", user_id)
+        await asyncio.to_thread(q.execute)
+        invalidate_alert_cache()
         return True
     except Exception:
         return False
 
 
-def _count_active_alerts(user_id: str) -> int:
-    try:
-        r = (
-            _db().table("alerts")
-            .select("id", count="exact")
-            .eq("user_id", user_id)
-            .is_("triggered_at", "null")
-            .execute()
-        )
-        return r.count or 0
-    except Exception:
-        return 0
+async def _get_bundle(phone: str) -> dict | None:
+    """Profile + active alerts + recent history in one RPC (migration 007).
+
+    None means the number isn't linked; RPC errors propagate to the caller.
+    """
+    q = _db().rpc("wa_bundle", {"p_phone": phone})
+    r = await asyncio.to_thread(q.execute)
+    return r.data or None
+
+
+_CRYPTO_METAL = ("BTC", "ETH", "XAU", "GOLD")
+_SYMBOL_STRIP = str.maketrans("", "", "/- ")  # "EUR/USD", "eur-usd" → EURUSD
 
 
 def _pip_size(symbol: str) -> float:
     s = symbol.upper()
     if "JPY" in s:
         return 0.01
-    if any(x in s for x in ("BTC", "ETH", "XAU", "GOLD")):
+    if any(x in s for x in _CRYPTO_METAL):
         return 0.01
     return 0.0001
 
 
 # ── Menu senders ──────────────────────────────────────────────────────────────
 
+_ALERT_EMOJI = {"touch": "🎯", "cross": "⚡", "near": "📍"}
+
+
+def _format_alert_line(a: dict, idx: int | None = None, detail: bool = False) -> str:
+    """One alert as a list line; detail adds the cross direction and near pip buffer."""
+    emoji = _ALERT_EMOJI.get(a["alert_type"], "🔔")
+    num = f"{idx}. " if idx is not None else ""
+    if not detail:
+        return f"{num}{emoji} {a['symbol']} {a['alert_type']} @ {a['price']}"
+    direction = f" ({a['direction']})" if a.get("direction") else ""
+    pip_buf = f" ±{a['pip_buffer']}pip" if a.get("pip_buffer") else ""
+    return f"{num}{emoji} {a['symbol']} {a['alert_type']}{direction} @ {a['price']}{pip_buf}"
+
+
+# Static menu payloads — built once, shared by every send
+_MAIN_MENU_SECTIONS = [{
+    "title": "Features",
+    "rows": [
+        {"id": "menu_alerts", "title": "🔔 Alerts", "description": "Create, view and delete price alerts"},
+        {"id": "menu_calc", "title": "🧮 Calculator", "description": "Risk/Reward, Position Size, Pip Value"},
+        {"id": "menu_history", "title": "📜 History", "description": "View your triggered alerts"},
+        {"id": "menu_settings", "title": "⚙️ Settings", "description": "View your account settings"},
+        {"id": "menu_chat", "title": "💬 AI Chat", "description": "Ask market questions"},
+    ],
+}]
+
+_ALERTS_MENU_BUTTONS = [
+    ("alert_create", "➕ Create Alert"),
+    ("alert_view", "📋 View Alerts"),
+    ("alert_delete", "🗑 Delete Alert"),
+]
+
+_CALC_MENU_SECTIONS = [{
+    "title": "Tools",
+    "rows": [
+        {"id": "calc_rr", "title": "⚖️ Risk/Reward", "description": "Calculate R:R ratio"},
+        {"id": "calc_ps", "title": "📐 Position Size", "description": "Calculate lot size"},
+        {"id": "calc_pip", "title": "📏 Pip Calculator", "description": "Count pips between prices"},
+    ],
+}]
+
+_ALERT_TYPE_SECTIONS = [{
+    "title": "Alert Types",
+    "rows": [
+        {"id": "type_touch", "title": "🎯 Touch", "description": "Triggers when price hits a level"},
+        {"id": "type_cross", "title": "⚡ Cross", "description": "Triggers when price crosses a level"},
+        {"id": "type_near", "title": "📍 Near", "description": "Triggers within X pips of a level"},
+        {"id": "type_zone", "title": "📦 Zone", "description": "Triggers when price enters a zone"},
+    ],
+}]
+
+_DIRECTION_BUTTONS = [("dir_above", "📈 Above"), ("dir_below", "📉 Below")]
+
+
 async def _send_main_menu(phone: str, greeting: str = "What would you like to do?") -> None:
-    await send_list_message(
-        phone,
-        f"🏠 *Main Menu*\n{greeting}",
-        "Open Menu",
-        [{
-            "title": "Features",
-            "rows": [
-                {"id": "menu_alerts", "title": "🔔 Alerts", "description": "Create, view and delete price alerts"},
-                {"id": "menu_calc", "title": "🧮 Calculator", "description": "Risk/Reward, Position Size, Pip Value"},
-                {"id": "menu_history", "title": "📜 History", "description": "View your triggered alerts"},
-                {"id": "menu_settings", "title": "⚙️ Settings", "description": "View your account settings"},
-                {"id": "menu_chat", "title": "💬 AI Chat", "description": "Ask market questions"},
-            ],
-        }],
-    )
+    await send_list_message(phone, f"🏠 *Main Menu*\n{greeting}", "Open Menu", _MAIN_MENU_SECTIONS)
 
 
 async def _send_alerts_menu(phone: str) -> None:
-    await send_button_message(
-        phone,
-        "🔔 *Alerts Menu*\nWhat would you like to do?",
-        [
-            ("alert_create", "➕ Create Alert"),
-            ("alert_view", "📋 View Alerts"),
-            ("alert_delete", "🗑 Delete Alert"),
-        ],
-    )
+    await send_button_message(phone, "🔔 *Alerts Menu*\nWhat would you like to do?", _ALERTS_MENU_BUTTONS)
 
 
 async def _send_calc_menu(phone: str) -> None:
-    await send_list_message(
+    await send_list_message(phone, "🧮 *Calculator*\nChoose a tool:", "Choose Tool", _CALC_MENU_SECTIONS)
+
+
+async def _send_not_linked(phone: str) -> None:
+    await send_text_message(
         phone,
-        "🧮 *Calculator*\nChoose a tool:",
-        "Choose Tool",
-        [{
-            "title": "Tools",
-            "rows": [
-                {"id": "calc_rr", "title": "⚖️ Risk/Reward", "description": "Calculate R:R ratio"},
-                {"id": "calc_ps", "title": "📐 Position Size", "description": "Calculate lot size"},
-                {"id": "calc_pip", "title": "📏 Pip Calculator", "description": "Count pips between prices"},
-            ],
-        }],
+        "⚠️ Your WhatsApp is not linked to a MarketWatch account.\n\n"
+        "Send: *link your@email.com* to connect your account.",
     )
 
 
 async def _require_linked(phone: str) -> dict | None:
-    profile = _get_profile(phone)
+    profile = await _get_profile(phone)
     if not profile:
-        await send_text_message(
-            phone,
-            "⚠️ Your WhatsApp is not linked to a MarketWatch account.\n\n"
-            "Send: *link your@email.com* to connect your account.",
-        )
-        return None
+        await _send_not_linked(phone)
     return profile
 
 
+async def _require_bundle(phone: str) -> dict | None:
+    try:
+        bundle = await _get_bundle(phone)
+    except Exception as exc:
+        # A DB hiccup isn't a missing link — don't tell a linked user to re-link
+        logger.error("WA bundle fetch error: %s", exc)
+        await send_text_message(phone, "⚠️ Couldn't load your account right now. Please try again in a moment.")
+        return None
+    if not bundle:
+        await _send_not_linked(phone)
+    return bundle
+
+
 # ── Main message router ───────────────────────────────────────────────────────
 
 async def _handle_wa_message(phone: str, text: str, msg_type: str = "text") -> None:
@@ -215,7 +254,9 @@ async def _handle_wa_message(phone: str, text: str, msg_type: str = "text") -> N
     if lower.startswith("link ") and "@" in text:
         email = text.split(" ", 1)[1].strip().lower()
         try:
-            r = _db().table("profiles").update({"whatsapp": phone}).eq("email", email).execute()
+            q = _db().rpc("link_whatsapp", {"p_email": email, "p_phone": phone})
+            r = await asyncio.to_thread(q.execute)
+            _profile_cache.pop(phone, None)
             if r.data:
                 profile = r.data[0]
                 name = profile.get("full_name") or profile.get("email")
@@ -231,7 +272,7 @@ async def _handle_wa_message(phone: str, text: str, msg_type: str = "text") -> N
         return
 
     # Gate all other interactions behind a linked Pro account
-    profile = _get_profile(phone)
+    profile = await _get_profile(phone)
     if not profile:
         await send_text_message(
             phone,
@@ -277,7 +318,7 @@ async def _handle_wa_message(phone: str, text: str, msg_type: str = "text") -> N
 
     # Interactive replies (button/list selections)
     if msg_type in ("button_reply", "list_reply"):
-        await _handle_selection(phone, text)
+        await _handle_selection(phone, text, profile)
         return
 
     # State machine for multi-step flows
@@ -290,369 +331,412 @@ async def _handle_wa_message(phone: str, text: str, msg_type: str = "text") -> N
         return
 
     # AI chat fallback
-    await _handle_ai_chat(phone, text)
+    await _handle_ai_chat(phone, text, profile)
 
 
-async def _handle_selection(phone: str, selection_id: str) -> None:
-    """Handle button/list reply selections."""
+# ── Menu selections ──────────────────────────────────────────────────────────
 
-    # Main menu selections
-    if selection_id == "menu_alerts":
-        _clear_state(phone)
-        await _send_alerts_menu(phone)
+async def _sel_menu_alerts(phone: str, profile: dict | None) -> None:
+    _clear_state(phone)
+    await _send_alerts_menu(phone)
 
-    elif selection_id == "menu_calc":
-        _clear_state(phone)
-        await _send_calc_menu(phone)
-
-    elif selection_id == "menu_history":
-        profile = await _require_linked(phone)
-        if not profile:
-            return
-        history = _get_history(profile["id"])
-        if not history:
-            await send_text_message(phone, "📭 No triggered alerts yet.")
-            return
-        lines = ["📜 *Recent Triggered Alerts*\n"]
-        for a in history:
-            emoji = {"touch": "🎯", "cross": "⚡", "near": "📍"}.get(a["alert_type"], "🔔")
-            lines.append(f"{emoji} {a['symbol']} — {a['alert_type']} @ {a['price']}")
-        await send_text_message(phone, "\n".join(lines))
-
-    elif selection_id == "menu_settings":
-        profile = await _require_linked(phone)
-        if not profile:
-            return
-        wa = profile.get("whatsapp") or "Not set"
-        tier = profile.get("tier", "free")
-        await send_text_message(
-            phone,
-            f"⚙️ *Your Settings*\n\n"
-            f"📧 Email: {profile.get('email', 'N/A')}\n"
-            f"🏅 Plan: {tier.upper()}\n"
-            f"📱 WhatsApp: {wa}\n\n"
-            "Send *menu* to go back.",
-        )
 
-    elif selection_id == "menu_chat":
-        _set_state(phone, "chat_mode")
-        await send_text_message(
-            phone,
-            "💬 *AI Chat Mode*\n\nAsk me any Forex or market question.\nSend *menu* to return to main menu.",
-        )
+async def _sel_menu_calc(phone: str, profile: dict | None) -> None:
+    _clear_state(phone)
+    await _send_calc_menu(phone)
 
-    # Alert actions
-    elif selection_id == "alert_create":
-        profile = await _require_linked(phone)
-        if not profile:
-            return
-        _set_state(phone, "alert_symbol", {"user_id": profile["id"]})
-        await send_text_message(phone, "📝 *Create Alert — Step 1/4*\n\nEnter the trading symbol:\n(e.g. EURUSD, BTCUSD, XAUUSD)")
-
-    elif selection_id == "alert_view":
-        profile = await _require_linked(phone)
-        if not profile:
-            return
-        alerts = _get_alerts(profile["id"])
-        if not alerts:
-            await send_text_message(phone, "📭 No active alerts.")
-            return
-        lines = ["📋 *Your Active Alerts*\n"]
-        for a in alerts:
-            emoji = {"touch": "🎯", "cross": "⚡", "near": "📍"}.get(a["alert_type"], "🔔")
-            direction = f" ({a['direction']})" if a.get("direction") else ""
-            pip_buf = f" ±{a['pip_buffer']}pip" if a.get("pip_buffer") else ""
-            lines.append(f"{emoji} {a['symbol']} {a['alert_type']}{direction} @ {a['price']}{pip_buf}")
-        await send_text_message(phone, "\n".join(lines))
-
-    elif selection_id == "alert_delete":
-        profile = await _require_linked(phone)
-        if not profile:
-            return
-        alerts = _get_alerts(profile["id"])
-        if not alerts:
-            await send_text_message(phone, "📭 No active alerts to delete.")
-            return
-        # Store alerts in state for deletion flow
-        _set_state(phone, "alert_delete_select", {"user_id": profile["id"], "alerts": alerts})
-        lines = ["🗑 *Delete Alert*\n\nReply with the number of the alert to delete:\n"]
-        for i, a in enumerate(alerts, 1):
-            emoji = {"touch": "🎯", "cross": "⚡", "near": "📍"}.get(a["alert_type"], "🔔")
-            lines.append(f"{i}. {emoji} {a['symbol']} {a['alert_type']} @ {a['price']}")
-        await send_text_message(phone, "\n".join(lines))
-
-    # Calculator
-    elif selection_id == "calc_rr":
-        _set_state(phone, "calc_rr_entry")
-        await send_text_message(phone, "⚖️ *Risk/Reward Calculator*\n\n*Step 1/3* — Enter your entry price:")
-
-    elif selection_id == "calc_ps":
-        _set_state(phone, "calc_ps_balance")
-        await send_text_message(phone, "📐 *Position Size Calculator*\n\n*Step 1/4* — Enter your account balance (USD):")
-
-    elif selection_id == "calc_pip":
-        _set_state(phone, "calc_pip_symbol")
-        await send_text_message(phone, "📏 *Pip Calculator*\n\n*Step 1/3* — Enter the symbol (e.g. EURUSD):")
 
+async def _sel_menu_history(phone: str, profile: dict | None) -> None:
+    bundle = await _require_bundle(phone)
+    if not bundle:
+        return
+    history = bundle["history"]
+    if not history:
+        await send_text_message(phone, "📭 No triggered alerts yet.")
+        return
+    body = "\n".join(
+        f"{_ALERT_EMOJI.get(a['alert_type'], '🔔')} {a['symbol']} — {a['alert_type']} @ {a['price']}"
+        for a in history
+    )
+    await send_text_message(phone, f"📜 *Recent Triggered Alerts*\n\n{body}")
 
-async def _handle_state_input(phone: str, text: str, s: str, d: dict) -> None:
-    """Handle text inputs during multi-step flows."""
 
-    # Alert type selection
-    if s == "alert_symbol":
-        symbol = text.upper().replace("/", "").replace("-", "").replace(" ", "")
-        _set_state(phone, "alert_type", {**d, "symbol": symbol})
-        await send_list_message(
-            phone,
-            f"Symbol: {symbol}\n\n*Step 2/4* — Select alert type:",
-            "Select Type",
-            [{
-                "title": "Alert Types",
-                "rows": [
-                    {"id": "type_touch", "title": "🎯 Touch", "description": "Triggers when price hits a level"},
-                    {"id": "type_cross", "title": "⚡ Cross", "description": "Triggers when price crosses a level"},
-                    {"id": "type_near", "title": "📍 Near", "description": "Triggers within X pips of a level"},
-                    {"id": "type_zone", "title": "📦 Zone", "description": "Triggers when price enters a zone"},
-                ],
-            }],
-        )
+async def _sel_menu_settings(phone: str, profile: dict | None) -> None:
+    profile = profile or await _require_linked(phone)
+    if not profile:
         return
+    wa = profile.get("whatsapp") or "Not set"
+    tier = profile.get("tier", "free")
+    await send_text_message(
+        phone,
+        f"⚙️ *Your Settings*\n\n"
+        f"📧 Email: {profile.get('email', 'N/A')}\n"
+        f"🏅 Plan: {tier.upper()}\n"
+        f"📱 WhatsApp: {wa}\n\n"
+        "Send *menu* to go back.",
+    )
 
-    if s == "alert_type":
-        t = text.lower()
-        if t not in ("touch", "cross", "near", "zone"):
-            await send_text_message(phone, "Please reply with: touch, cross, near, or zone")
-            return
-        _set_state(phone, "alert_price", {**d, "alert_type": t})
-        label = "zone low (lower bound)" if t == "zone" else "target price"
-        await send_text_message(phone, f"Type: {t}\n\n*Step 3/4* — Enter the {label}:")
-        return
 
-    if s == "alert_price":
-        try:
-            price = float(text)
-        except ValueError:
-            await send_text_message(phone, "❌ Invalid price. Enter a number (e.g. 1.08500):")
-            return
-        alert_type = d.get("alert_type")
-        if alert_type == "cross":
-            _set_state(phone, "alert_direction", {**d, "price": price})
-            await send_button_message(
-                phone,
-                f"Target: {price}\n\nWhich direction should price come from?",
-                [("dir_above", "📈 Above"), ("dir_below", "📉 Below")],
-            )
-        elif alert_type == "near":
-            _set_state(phone, "alert_pip_buffer", {**d, "price": price})
-            await send_text_message(phone, f"Target: {price}\n\nEnter pip buffer (e.g. 5):")
-        elif alert_type == "zone":
-            _set_state(phone, "alert_zone_high", {**d, "price": price})
-            await send_text_message(phone, f"Zone Low: {price}\n\n*Step 4/4* — Enter the zone high (upper bound):")
-        else:
-            ok = _create_alert(d["user_id"], d["symbol"], alert_type, price, None, None)
-            _clear_state(phone)
-            if ok:
-                await send_text_message(phone, f"✅ Alert Created!\n\n🎯 {d['symbol']} touch alert at {price}\n\nSend *menu* to manage alerts.")
-            else:
-                await send_text_message(phone, "❌ Failed to create alert.")
-        return
+async def _sel_menu_chat(phone: str, profile: dict | None) -> None:
+    _set_state(phone, "chat_mode")
+    await send_text_message(
+        phone,
+        "💬 *AI Chat Mode*\n\nAsk me any Forex or market question.\nSend *menu* to return to main menu.",
+    )
 
-    if s == "alert_zone_high":
-        try:
-            zone_high = float(text)
-        except ValueError:
-            await send_text_message(phone, "❌ Enter a valid price:")
-            return
-        if zone_high <= d["price"]:
-            await send_text_message(phone, f"❌ Zone high must be above zone low ({d['price']}):")
-            return
-        ok = _create_alert(d["user_id"], d["symbol"], "zone", d["price"], None, None, zone_high)
-        _clear_state(phone)
-        msg = (
-            f"✅ Alert Created!\n\n📦 {d['symbol']} zone alert\n"
-            f"Triggers when price enters {d['price']} – {zone_high}"
-            if ok else "❌ Failed to create alert."
-        )
-        await send_text_message(phone, msg + "\n\nSend *menu* to manage alerts.")
-        return
 
-    if s == "alert_direction":
-        t = text.lower()
-        if t not in ("above", "below"):
-            await send_button_message(phone, "Select direction:", [("dir_above", "📈 Above"), ("dir_below", "📉 Below")])
-            return
-        ok = _create_alert(d["user_id"], d["symbol"], d["alert_type"], d["price"], t, None)
-        _clear_state(phone)
-        msg = f"✅ Alert Created!\n\n⚡ {d['symbol']} cross alert at {d['price']} from {t}" if ok else "❌ Failed to create alert."
-        await send_text_message(phone, msg + "\n\nSend *menu* to manage alerts.")
-        return
+# Alert actions
 
-    if s == "alert_pip_buffer":
-        try:
-            pip_buffer = float(text)
-        except ValueError:
-            await send_text_message(phone, "❌ Enter a valid number (e.g. 5):")
-            return
-        ok = _create_alert(d["user_id"], d["symbol"], d["alert_type"], d["price"], None, pip_buffer)
-        _clear_state(phone)
-        msg = f"✅ Alert Created!\n\n📍 {d['symbol']} near alert at {d['price']} ±{pip_buffer} pips" if ok else "❌ Failed to create alert."
-        await send_text_message(phone, msg + "\n\nSend *menu* to manage alerts.")
+async def _sel_alert_create(phone: str, profile: dict | None) -> None:
+    profile = profile or await _require_linked(phone)
+    if not profile:
         return
+    _set_state(phone, "alert_symbol", {"user_id": profile["id"]})
+    await send_text_message(phone, "📝 *Create Alert — Step 1/4*\n\nEnter the trading symbol:\n(e.g. EURUSD, BTCUSD, XAUUSD)")
 
-    if s == "alert_delete_select":
-        try:
-            idx = int(text) - 1
-            alerts = d.get("alerts", [])
-            if idx < 0 or idx >= len(alerts):
-                raise ValueError
-            alert = alerts[idx]
-        except (ValueError, IndexError):
-            await send_text_message(phone, f"❌ Enter a number between 1 and {len(d.get('alerts', []))}:")
-            return
-        ok = _delete_alert(alert["id"], d["user_id"])
-        _clear_state(phone)
-        emoji = {"touch": "🎯", "cross": "⚡", "near": "📍"}.get(alert["alert_type"], "🔔")
-        msg = f"✅ Deleted: {emoji} {alert['symbol']} {alert['alert_type']} @ {alert['price']}" if ok else "❌ Failed to delete alert."
-        await send_text_message(phone, msg + "\n\nSend *menu* to continue.")
-        return
 
-    # Alert type / direction via button_reply text
-    if s == "alert_type" and text.lower() in ("type_touch", "type_cross", "type_near"):
-        await _handle_selection(phone, text.lower())
+async def _sel_alert_view(phone: str, profile: dict | None) -> None:
+    bundle = await _require_bundle(phone)
+    if not bundle:
         return
-
-    if s == "alert_direction" and text.lower() in ("dir_above", "dir_below"):
-        await _handle_selection(phone, text.lower())
+    alerts = bundle["alerts"]
+    if not alerts:
+        await send_text_message(phone, "📭 No active alerts.")
         return
+    body = "\n".join(_format_alert_line(a, detail=True) for a in alerts)
+    await send_text_message(phone, f"📋 *Your Active Alerts*\n\n{body}")
 
-    # Risk/Reward
-    if s == "calc_rr_entry":
-        try:
-            _set_state(phone, "calc_rr_sl", {**d, "entry": float(text)})
-            await send_text_message(phone, "*Step 2/3* — Enter your stop loss price:")
-        except ValueError:
-            await send_text_message(phone, "❌ Enter a valid price:")
-        return
 
-    if s == "calc_rr_sl":
-        try:
-            _set_state(phone, "calc_rr_tp", {**d, "sl": float(text)})
-            await send_text_message(phone, "*Step 3/3* — Enter your take profit price:")
-        except ValueError:
-            await send_text_message(phone, "❌ Enter a valid price:")
+async def _sel_alert_delete(phone: str, profile: dict | None) -> None:
+    bundle = await _require_bundle(phone)
+    if not bundle:
         return
-
-    if s == "calc_rr_tp":
-        try:
-            tp = float(text)
-            entry, sl = d["entry"], d["sl"]
-            risk = abs(entry - sl)
-            reward = abs(tp - entry)
-            ratio = round(reward / risk, 2) if risk > 0 else 0
-            pip = 0.0001
-            _clear_state(phone)
-            await send_text_message(
-                phone,
-                f"⚖️ *Risk/Reward Result*\n\n"
-                f"Entry: {entry}  |  SL: {sl}  |  TP: {tp}\n\n"
-                f"Risk: {round(risk/pip,1)} pips\n"
-                f"Reward: {round(reward/pip,1)} pips\n"
-                f"Ratio: 1:{ratio}\n\n"
-                "Send *calc* to run another calculation.",
-            )
-        except ValueError:
-            await send_text_message(phone, "❌ Enter a valid price:")
+    alerts = bundle["alerts"]
+    if not alerts:
+        await send_text_message(phone, "📭 No active alerts to delete.")
         return
+    # Store alerts in state for deletion flow
+    _set_state(phone, "alert_delete_select", {"user_id": bundle["profile"]["id"], "alerts": alerts})
+    body = "\n".join(_format_alert_line(a, i) for i, a in enumerate(alerts, 1))
+    await send_text_message(phone, f"🗑 *Delete Alert*\n\nReply with the number of the alert to delete:\n\n{body}")
 
-    # Position size
-    if s == "calc_ps_balance":
-        try:
-            _set_state(phone, "calc_ps_risk", {**d, "balance": float(text)})
-            await send_text_message(phone, "*Step 2/4* — Enter your risk % per trade (e.g. 1 or 2):")
-        except ValueError:
-            await send_text_message(phone, "❌ Enter a valid number:")
+
+# Calculator
+
+async def _sel_calc_rr(phone: str, profile: dict | None) -> None:
+    _set_state(phone, "calc_rr_entry")
+    await send_text_message(phone, "⚖️ *Risk/Reward Calculator*\n\n*Step 1/3* — Enter your entry price:")
+
+
+async def _sel_calc_ps(phone: str, profile: dict | None) -> None:
+    _set_state(phone, "calc_ps_balance")
+    await send_text_message(phone, "📐 *Position Size Calculator*\n\n*Step 1/4* — Enter your account balance (USD):")
+
+
+async def _sel_calc_pip(phone: str, profile: dict | None) -> None:
+    _set_state(phone, "calc_pip_symbol")
+    await send_text_message(phone, "📏 *Pip Calculator*\n\n*Step 1/3* — Enter the symbol (e.g. EURUSD):")
+
+
+_SELECTION_HANDLERS: dict[str, Callable[[str, dict | None], Awaitable[None]]] = {
+    "menu_alerts": _sel_menu_alerts,
+    "menu_calc": _sel_menu_calc,
+    "menu_history": _sel_menu_history,
+    "menu_settings": _sel_menu_settings,
+    "menu_chat": _sel_menu_chat,
+    "alert_create": _sel_alert_create,
+    "alert_view": _sel_alert_view,
+    "alert_delete": _sel_alert_delete,
+    "calc_rr": _sel_calc_rr,
+    "calc_ps": _sel_calc_ps,
+    "calc_pip": _sel_calc_pip,
+}
+
+
+async def _handle_selection(phone: str, selection_id: str, profile: dict | None = None) -> None:
+    """Handle button/list reply selections.
+
+    ``profile`` is the row already loaded by _handle_wa_message, when there is one.
+    """
+    handler = _SELECTION_HANDLERS.get(selection_id)
+    if handler:
+        await handler(phone, profile)
         return
+    # Replies inside a flow (alert type list, direction buttons) feed the state machine
+    state = _get_state(phone)
+    await _handle_state_input(phone, selection_id, state["state"], state["data"])
 
-    if s == "calc_ps_risk":
-        try:
-            _set_state(phone, "calc_ps_sl_pips", {**d, "risk_pct": float(text)})
-            await send_text_message(phone, "*Step 3/4* — Enter stop loss in pips:")
-        except ValueError:
-            await send_text_message(phone, "❌ Enter a valid number:")
+
+# ── Multi-step flows ──────────────────────────────────────────────────────────
+
+# Alert type selection
+
+async def _st_alert_symbol(phone: str, text: str, d: dict) -> None:
+    symbol = text.upper().translate(_SYMBOL_STRIP)
+    _set_state(phone, "alert_type", {**d, "symbol": symbol})
+    await send_list_message(
+        phone,
+        f"Symbol: {symbol}\n\n*Step 2/4* — Select alert type:",
+        "Select Type",
+        _ALERT_TYPE_SECTIONS,
+    )
+
+
+async def _st_alert_type(phone: str, text: str, d: dict) -> None:
+    t = text.lower().removeprefix("type_")
+    if t not in ("touch", "cross", "near", "zone"):
+        await send_text_message(phone, "Please reply with: touch, cross, near, or zone")
         return
+    _set_state(phone, "alert_price", {**d, "alert_type": t})
+    label = "zone low (lower bound)" if t == "zone" else "target price"
+    await send_text_message(phone, f"Type: {t}\n\n*Step 3/4* — Enter the {label}:")
 
-    if s == "calc_ps_sl_pips":
-        try:
-            _set_state(phone, "calc_ps_pip_val", {**d, "sl_pips": float(text)})
-            await send_text_message(phone, "*Step 4/4* — Enter pip value per standard lot (e.g. 10 for EURUSD):")
-        except ValueError:
-            await send_text_message(phone, "❌ Enter a valid number:")
+
+async def _st_alert_price(phone: str, text: str, d: dict) -> None:
+    try:
+        price = float(text)
+    except ValueError:
+        await send_text_message(phone, "❌ Invalid price. Enter a number (e.g. 1.08500):")
         return
+    alert_type = d.get("alert_type")
+    if alert_type == "cross":
+        _set_state(phone, "alert_direction", {**d, "price": price})
+        await send_button_message(
+            phone,
+            f"Target: {price}\n\nWhich direction should price come from?",
+            _DIRECTION_BUTTONS,
+        )
+    elif alert_type == "near":
+        _set_state(phone, "alert_pip_buffer", {**d, "price": price})
+        await send_text_message(phone, f"Target: {price}\n\nEnter pip buffer (e.g. 5):")
+    elif alert_type == "zone":
+        _set_state(phone, "alert_zone_high", {**d, "price": price})
+        await send_text_message(phone, f"Zone Low: {price}\n\n*Step 4/4* — Enter the zone high (upper bound):")
+    else:
+        ok = await _create_alert(d["user_id"], d["symbol"], alert_type, price, None, None)
+        _clear_state(phone)
+        if ok:
+            await send_text_message(phone, f"✅ Alert Created!\n\n🎯 {d['symbol']} touch alert at {price}\n\nSend *menu* to manage alerts.")
+        else:
+            await send_text_message(phone, "❌ Failed to create alert.")
 
-    if s == "calc_ps_pip_val":
-        try:
-            pip_val = float(text)
-            risk_amt = round(d["balance"] * (d["risk_pct"] / 100), 2)
-            lots = round(risk_amt / (d["sl_pips"] * pip_val), 4) if d["sl_pips"] * pip_val > 0 else 0
-            units = int(lots * 100_000)
-            _clear_state(phone)
-            await send_text_message(
-                phone,
-                f"📐 *Position Size Result*\n\n"
-                f"Balance: ${d['balance']:,.2f}  |  Risk: {d['risk_pct']}%\n"
-                f"Stop Loss: {d['sl_pips']} pips\n\n"
-                f"Lot Size: {lots}\n"
-                f"Units: {units:,}\n"
-                f"Risk Amount: ${risk_amt:,.2f}\n\n"
-                "Send *calc* to run another calculation.",
-            )
-        except ValueError:
-            await send_text_message(phone, "❌ Enter a valid number:")
+
+async def _st_alert_zone_high(phone: str, text: str, d: dict) -> None:
+    try:
+        zone_high = float(text)
+    except ValueError:
+        await send_text_message(phone, "❌ Enter a valid price:")
+        return
+    if zone_high <= d["price"]:
+        await send_text_message(phone, f"❌ Zone high must be above zone low ({d['price']}):")
         return
+    ok = await _create_alert(d["user_id"], d["symbol"], "zone", d["price"], None, None, zone_high)
+    _clear_state(phone)
+    msg = (
+        f"✅ Alert Created!\n\n📦 {d['symbol']} zone alert\n"
+        f"Triggers when price enters {d['price']} – {zone_high}"
+        if ok else "❌ Failed to create alert."
+    )
+    await send_text_message(phone, msg + "\n\nSend *menu* to manage alerts.")
 
-    # Pip calculator
-    if s == "calc_pip_symbol":
-        _set_state(phone, "calc_pip_p1", {**d, "symbol": text.upper()})
-        await send_text_message(phone, f"Symbol: {text.upper()}\n\n*Step 2/3* — Enter price from:")
+
+async def _st_alert_direction(phone: str, text: str, d: dict) -> None:
+    t = text.lower().removeprefix("dir_")
+    if t not in ("above", "below"):
+        await send_button_message(phone, "Select direction:", _DIRECTION_BUTTONS)
         return
+    ok = await _create_alert(d["user_id"], d["symbol"], d["alert_type"], d["price"], t, None)
+    _clear_state(phone)
+    msg = f"✅ Alert Created!\n\n⚡ {d['symbol']} cross alert at {d['price']} from {t}" if ok else "❌ Failed to create alert."
+    await send_text_message(phone, msg + "\n\nSend *menu* to manage alerts.")
 
-    if s == "calc_pip_p1":
-        try:
-            _set_state(phone, "calc_pip_p2", {**d, "p1": float(text)})
-            await send_text_message(phone, "*Step 3/3* — Enter price to:")
-        except ValueError:
-            await send_text_message(phone, "❌ Enter a valid price:")
+
+async def _st_alert_pip_buffer(phone: str, text: str, d: dict) -> None:
+    try:
+        pip_buffer = float(text)
+    except ValueError:
+        await send_text_message(phone, "❌ Enter a valid number (e.g. 5):")
         return
+    ok = await _create_alert(d["user_id"], d["symbol"], d["alert_type"], d["price"], None, pip_buffer)
+    _clear_state(phone)
+    msg = f"✅ Alert Created!\n\n📍 {d['symbol']} near alert at {d['price']} ±{pip_buffer} pips" if ok else "❌ Failed to create alert."
+    await send_text_message(phone, msg + "\n\nSend *menu* to manage alerts.")
 
-    if s == "calc_pip_p2":
-        try:
-            p2 = float(text)
-            p1 = d["p1"]
-            symbol = d["symbol"]
-            diff = p2 - p1
-            pips = round(abs(diff) / _pip_size(symbol), 1)
-            direction = "up 📈" if diff > 0 else "down 📉"
-            _clear_state(phone)
-            await send_text_message(
-                phone,
-                f"📏 *Pip Calculator Result*\n\n"
-                f"Symbol: {symbol}\n"
-                f"{p1} → {p2}\n\n"
-                f"Movement: {pips} pips {direction}\n\n"
-                "Send *calc* to run another calculation.",
-            )
-        except ValueError:
-            await send_text_message(phone, "❌ Enter a valid price:")
+
+async def _st_alert_delete_select(phone: str, text: str, d: dict) -> None:
+    try:
+        idx = int(text) - 1
+        alerts = d.get("alerts", [])
+        if idx < 0 or idx >= len(alerts):
+            raise ValueError
+        alert = alerts[idx]
+    except (ValueError, IndexError):
+        await send_text_message(phone, f"❌ Enter a number between 1 and {len(d.get('alerts', []))}:")
         return
+    ok = await _delete_alert(alert["id"], d["user_id"])
+    _clear_state(phone)
+    msg = f"✅ Deleted: {_format_alert_line(alert)}" if ok else "❌ Failed to delete alert."
+    await send_text_message(phone, msg + "\n\nSend *menu* to continue.")
+
+
+# Risk/Reward
+
+async def _st_calc_rr_entry(phone: str, text: str, d: dict) -> None:
+    try:
+        _set_state(phone, "calc_rr_sl", {**d, "entry": float(text)})
+        await send_text_message(phone, "*Step 2/3* — Enter your stop loss price:")
+    except ValueError:
+        await send_text_message(phone, "❌ Enter a valid price:")
+
+
+async def _st_calc_rr_sl(phone: str, text: str, d: dict) -> None:
+    try:
+        _set_state(phone, "calc_rr_tp", {**d, "sl": float(text)})
+        await send_text_message(phone, "*Step 3/3* — Enter your take profit price:")
+    except ValueError:
+        await send_text_message(phone, "❌ Enter a valid price:")
+
+
+async def _st_calc_rr_tp(phone: str, text: str, d: dict) -> None:
+    try:
+        tp = float(text)
+        entry, sl = d["entry"], d["sl"]
+        risk = abs(entry - sl)
+        reward = abs(tp - entry)
+        ratio = round(reward / risk, 2) if risk > 0 else 0
+        pip = 0.0001
+        _clear_state(phone)
+        await send_text_message(
+            phone,
+            f"⚖️ *Risk/Reward Result*\n\n"
+            f"Entry: {entry}  |  SL: {sl}  |  TP: {tp}\n\n"
+            f"Risk: {round(risk/pip,1)} pips\n"
+            f"Reward: {round(reward/pip,1)} pips\n"
+            f"Ratio: 1:{ratio}\n\n"
+            "Send *calc* to run another calculation.",
+        )
+    except ValueError:
+        await send_text_message(phone, "❌ Enter a valid price:")
+
+
+# Position size
+
+async def _st_calc_ps_balance(phone: str, text: str, d: dict) -> None:
+    try:
+        _set_state(phone, "calc_ps_risk", {**d, "balance": float(text)})
+        await send_text_message(phone, "*Step 2/4* — Enter your risk % per trade (e.g. 1 or 2):")
+    except ValueError:
+        await send_text_message(phone, "❌ Enter a valid number:")
+
+
+async def _st_calc_ps_risk(phone: str, text: str, d: dict) -> None:
+    try:
+        _set_state(phone, "calc_ps_sl_pips", {**d, "risk_pct": float(text)})
+        await send_text_message(phone, "*Step 3/4* — Enter stop loss in pips:")
+    except ValueError:
+        await send_text_message(phone, "❌ Enter a valid number:")
+
+
+async def _st_calc_ps_sl_pips(phone: str, text: str, d: dict) -> None:
+    try:
+        _set_state(phone, "calc_ps_pip_val", {**d, "sl_pips": float(text)})
+        await send_text_message(phone, "*Step 4/4* — Enter pip value per standard lot (e.g. 10 for EURUSD):")
+    except ValueError:
+        await send_text_message(phone, "❌ Enter a valid number:")
+
+
+async def _st_calc_ps_pip_val(phone: str, text: str, d: dict) -> None:
+    try:
+        pip_val = float(text)
+        risk_amt = round(d["balance"] * (d["risk_pct"] / 100), 2)
+        lots = round(risk_amt / (d["sl_pips"] * pip_val), 4) if d["sl_pips"] * pip_val > 0 else 0
+        units = int(lots * 100_000)
+        _clear_state(phone)
+        await send_text_message(
+            phone,
+            f"📐 *Position Size Result*\n\n"
+            f"Balance: ${d['balance']:,.2f}  |  Risk: {d['risk_pct']}%\n"
+            f"Stop Loss: {d['sl_pips']} pips\n\n"
+            f"Lot Size: {lots}\n"
+            f"Units: {units:,}\n"
+            f"Risk Amount: ${risk_amt:,.2f}\n\n"
+            "Send *calc* to run another calculation.",
+        )
+    except ValueError:
+        await send_text_message(phone, "❌ Enter a valid number:")
+
+
+# Pip calculator
+
+async def _st_calc_pip_symbol(phone: str, text: str, d: dict) -> None:
+    _set_state(phone, "calc_pip_p1", {**d, "symbol": text.upper()})
+    await send_text_message(phone, f"Symbol: {text.upper()}\n\n*Step 2/3* — Enter price from:")
+
+
+async def _st_calc_pip_p1(phone: str, text: str, d: dict) -> None:
+    try:
+        _set_state(phone, "calc_pip_p2", {**d, "p1": float(text)})
+        await send_text_message(phone, "*Step 3/3* — Enter price to:")
+    except ValueError:
+        await send_text_message(phone, "❌ Enter a valid price:")
+
+
+async def _st_calc_pip_p2(phone: str, text: str, d: dict) -> None:
+    try:
+        p2 = float(text)
+        p1 = d["p1"]
+        symbol = d["symbol"]
+        diff = p2 - p1
+        pips = round(abs(diff) / _pip_size(symbol), 1)
+        direction = "up 📈" if diff > 0 else "down 📉"
+        _clear_state(phone)
+        await send_text_message(
+            phone,
+            f"📏 *Pip Calculator Result*\n\n"
+            f"Symbol: {symbol}\n"
+            f"{p1} → {p2}\n\n"
+            f"Movement: {pips} pips {direction}\n\n"
+            "Send *calc* to run another calculation.",
+        )
+    except ValueError:
+        await send_text_message(phone, "❌ Enter a valid price:")
+
+
+_STATE_HANDLERS: dict[str, Callable[[str, str, dict], Awaitable[None]]] = {
+    "alert_symbol": _st_alert_symbol,
+    "alert_type": _st_alert_type,
+    "alert_price": _st_alert_price,
+    "alert_zone_high": _st_alert_zone_high,
+    "alert_direction": _st_alert_direction,
+    "alert_pip_buffer": _st_alert_pip_buffer,
+    "alert_delete_select": _st_alert_delete_select,
+    "calc_rr_entry": _st_calc_rr_entry,
+    "calc_rr_sl": _st_calc_rr_sl,
+    "calc_rr_tp": _st_calc_rr_tp,
+    "calc_ps_balance": _st_calc_ps_balance,
+    "calc_ps_risk": _st_calc_ps_risk,
+    "calc_ps_sl_pips": _st_calc_ps_sl_pips,
+    "calc_ps_pip_val": _st_calc_ps_pip_val,
+    "calc_pip_symbol": _st_calc_pip_symbol,
+    "calc_pip_p1": _st_calc_pip_p1,
+    "calc_pip_p2": _st_calc_pip_p2,
+}
+
+
+async def _handle_state_input(phone: str, text: str, s: str, d: dict) -> None:
+    """Handle text inputs during multi-step flows."""
+    handler = _STATE_HANDLERS.get(s)
+    if handler:
+        await handler(phone, text, d)
 
 
-async def _handle_ai_chat(phone: str, text: str) -> None:
-    profile = _get_profile(phone)
+async def _handle_ai_chat(phone: str, text: str, profile: dict | None = None) -> None:
+    profile = profile or await _get_profile(phone)
     tier = profile.get("tier", "free") if profile else "free"
-    history = _chat_history.get(phone, [])
-    user_msgs = [m for m in history if m["role"] == "user"]
+    history = _chat_history.get(phone) or deque(maxlen=CHAT_HISTORY_TURNS)
+    user_msgs = sum(1 for m in history if m["role"] == "user")
 
-    if tier == "free" and len(user_msgs) >= FREE_CHAT_LIMIT:
+    if tier == "free" and user_msgs >= FREE_CHAT_LIMIT:
         await send_text_message(
             phone,
             f"⚠️ You've used your {FREE_CHAT_LIMIT} free AI questions this session.\n\n"
@@ -661,18 +745,37 @@ async def _handle_ai_chat(phone: str, text: str) -> None:
         return
 
     history.append({"role": "user", "content": text})
-    _chat_history[phone] = history
+    _remember(_chat_history, phone, history)
 
     try:
-        reply = await asyncio.to_thread(ai_chat, history)
+        reply = await ai_chat(list(history))
         history.append({"role": "assistant", "content": reply})
-        _chat_history[phone] = history[-20:]
         await send_text_message(phone, reply)
     except Exception as exc:
         logger.error("WA AI chat error: %s", exc)
         await send_text_message(phone, "⚠️ AI is temporarily unavailable. Please try again shortly.")
 
 
+async def _process_message(phone: str, text: str, msg_type: str) -> None:
+    # Cap in-flight handlers so a burst of messages can't exhaust the Supabase pool
+    async with _message_sem:
+        try:
+            await _handle_wa_message(phone, text, msg_type)
+        except Exception as exc:
+            logger.error("WA message error: %s", exc, exc_info=True)
+
+
+def _dispatch(phone: str, text: str, msg_type: str) -> None:
+    task = asyncio.create_task(_process_message(phone, text, msg_type))
+    # Hold a reference until done — the loop only keeps weak refs to tasks
+    _message_tasks.add(task)
+    task.add_done_callback(_message_tasks.discard)
+
+
+SIGNATURE_THREAD_MIN_BYTES = 64 * 1024
+MAX_WEBHOOK_BYTES = 1024 * 1024  # Meta batches are a few KB; anything near this is junk
+
+
 # ── Webhook endpoints ─────────────────────────────────────────────────────────
 
 @router.get("/webhook", response_class=PlainTextResponse)
@@ -694,15 +797,39 @@ async def whatsapp_receive(
     x_hub_signature_256: str = Header(default=""),
 ) -> dict:
     """Receive and route incoming WhatsApp messages."""
-    payload = await request.body()
-
-    if x_hub_signature_256 and not verify_whatsapp_signature(payload, x_hub_signature_256):
+    # Fast path: a declared oversized body is rejected before reading anything
+    try:
+        content_length = int(request.headers.get("content-length", "0"))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid Content-Length")
+    if content_length > MAX_WEBHOOK_BYTES:
+        raise HTTPException(status_code=413, detail="Payload too large")
+
+    # Chunked bodies carry no length, so the cap is enforced while streaming too
+    buf = bytearray()
+    async for chunk in request.stream():
+        buf += chunk
+        if len(buf) > MAX_WEBHOOK_BYTES:
+            raise HTTPException(status_code=413, detail="Payload too large")
+    payload = bytes(buf)
+    if not payload and not x_hub_signature_256:
+        raise HTTPException(status_code=400, detail="Empty payload")
+
+    if x_hub_signature_256:
+        # hashlib drops the GIL on large buffers; a thread hop only pays off there
+        if len(payload) >= SIGNATURE_THREAD_MIN_BYTES:
+            valid = await asyncio.to_thread(verify_whatsapp_signature, payload, x_hub_signature_256)
+        else:
+            valid = verify_whatsapp_signature(payload, x_hub_signature_256)
+    else:
+        valid = True
+    if not valid:
         logger.warning("WhatsApp webhook: invalid signature")
         raise HTTPException(status_code=400, detail="Invalid signature")
 
     try:
-        body = await request.json()
-    except Exception:
+        body = orjson.loads(payload)
+    except orjson.JSONDecodeError:
         raise HTTPException(status_code=422, detail="Invalid JSON")
 
     for entry in body.get("entry", []):
@@ -715,16 +842,16 @@ async def whatsapp_receive(
                 if msg_type == "text":
                     text = msg.get("text", {}).get("body", "").strip()
                     if text:
-                        asyncio.create_task(_handle_wa_message(phone, text, "text"))
+                        _dispatch(phone, text, "text")
 
                 elif msg_type == "interactive":
                     interactive = msg.get("interactive", {})
                     i_type = interactive.get("type")
                     if i_type == "button_reply":
                         sel_id = interactive["button_reply"]["id"]
-                        asyncio.create_task(_handle_wa_message(phone, sel_id, "button_reply"))
+                        _dispatch(phone, sel_id, "button_reply")
                     elif i_type == "list_reply":
                         sel_id = interactive["list_reply"]["id"]
-                        asyncio.create_task(_handle_wa_message(phone, sel_id, "list_reply"))
+                        _dispatch(phone, sel_id, "list_reply")
 
     return {"status": "ok"}
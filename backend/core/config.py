@@ -1,8 +1,10 @@
+from functools import lru_cache
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
 class Settings(BaseSettings):
-    model_config = SettingsConfigDict(env_file=".env", extra="ignore")
+    model_config = SettingsConfigDict(env_file=".env", extra="ignore", frozen=True)
 
     SUPABASE_URL: str
     SUPABASE_SERVICE_KEY: str
@@ -17,4 +19,10 @@ class Settings(BaseSettings):
     RESEND_API_KEY: str = ""
 
 
-settings = Settings()
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """The process-wide Settings; usable as a FastAPI dependency and resettable via cache_clear()."""
+    return Settings()
+
+
+settings = get_settings()
@@ -0,0 +1,16 @@
+"""Shared Supabase client — one instance (and HTTP connection pool) per process."""
+
+from functools import lru_cache
+
+from supabase import Client, ClientOptions, create_client
+
+from core.config import settings
+
+
+@lru_cache(maxsize=1)
+def get_supabase() -> Client:
+    return create_client(
+        settings.SUPABASE_URL,
+        settings.SUPABASE_SERVICE_KEY,
+        options=ClientOptions(postgrest_client_timeout=10, storage_client_timeout=10),
+    )
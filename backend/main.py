@@ -5,6 +5,7 @@ from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 
 from api.payments import router as payments_router
 from api.trade import router as trade_router
@@ -16,8 +17,14 @@ from api.market import router as market_router
 from api.referral import router as referral_router
 from api.profile import router as profile_router
 from api.admin import router as admin_router
+from core.config import settings
+from core.db import get_supabase
 from services.worker import run_worker
 from services.reminder_worker import run_reminder_worker
+from services.email import close_client as close_email_client
+from services.fmp import close_client as close_fmp_client
+from services.telegram_service import close_bot, get_bot
+from services.whatsapp_service import close_client as close_whatsapp_client
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -25,32 +32,52 @@ logger = logging.getLogger(__name__)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    worker_task = asyncio.create_task(run_worker())
-    reminder_task = asyncio.create_task(run_reminder_worker())
+    # Build shared clients now so the first webhook doesn't pay for them
+    get_supabase()
+    if settings.TELEGRAM_BOT_TOKEN:
+        try:
+            await get_bot().get_me()
+        except Exception as exc:
+            logger.warning("Telegram bot warm-up failed: %s", exc)
+
+    tasks = (
+        asyncio.create_task(run_worker()),
+        asyncio.create_task(run_reminder_worker()),
+    )
     logger.info("FMP + reminder workers started")
     yield
-    for task in (worker_task, reminder_task):
+    for task in tasks:
         task.cancel()
-        try:
-            await task
-        except asyncio.CancelledError:
-            pass
+    # Both wind down at the same time; CancelledError comes back as a result
+    await asyncio.gather(*tasks, return_exceptions=True)
     logger.info("Background workers stopped")
+    await asyncio.gather(
+        close_fmp_client(),
+        close_email_client(),
+        close_whatsapp_client(),
+        close_bot(),
+    )
 
 
-app = FastAPI(title="MarketWatch AI API", version="1.0.0", lifespan=lifespan)
+app = FastAPI(
+    title="MarketWatch AI API",
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+)
 
 _frontend_url = os.getenv("FRONTEND_URL", "http://localhost:3000").rstrip("/")
-_allowed_origins = list(set(filter(None, [
+# Exact origins go through a set lookup; Starlette compiles the regex once at startup
+_allowed_origins = frozenset(filter(None, (
     "http://localhost:3000",
     "http://localhost:3001",
     _frontend_url,
-])))
+)))
 
 app.add_middleware(
     CORSMiddleware,
     allow_origins=_allowed_origins,
-    allow_origin_regex=r"https://.*\.railway\.app",
+    allow_origin_regex=r"https://[A-Za-z0-9.-]+\.railway\.app",
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
@@ -1,11 +1,18 @@
 """DeepSeek AI — market summaries, multi-timeframe analysis, reminders, chat."""
 
+import asyncio
 import re
-from openai import OpenAI
+from collections.abc import AsyncIterator
+from functools import lru_cache
+
+import orjson
+from openai import AsyncOpenAI
 
 from core.config import settings
 
 MODEL = "deepseek-chat"
+MAX_CONCURRENT_AI_CALLS = 8
+MAX_RETRIES = 3
 
 # ── System prompts ─────────────────────────────────────────────────────────────
 
@@ -64,68 +71,115 @@ _ALIASES: dict[str, str] = {
     "xag": "XAGUSD",
 }
 
-_SYMBOL_RE = re.compile(
-    r"\b([A-Z]{3}[\/\-]?[A-Z]{3})\b",
-    re.IGNORECASE,
-)
+# All aliases in one C-level scan instead of one substring search per alias.
+# Same result as checking them in table order: the lookahead reports aliases
+# that overlap, and the table-order alternation gives each position its
+# highest-priority alias, so the lowest-ranked hit overall wins.
+_ALIAS_RE = re.compile("(?=(" + "|".join(re.escape(a) for a in _ALIASES) + "))")
+_ALIAS_RANK = {alias: i for i, alias in enumerate(_ALIASES)}
+
+# Matched against upper-cased text, so no IGNORECASE case-folding per char
+_SYMBOL_RE = re.compile(r"\b([A-Z]{3})[/-]?([A-Z]{3})\b", re.ASCII)
 
 
 def detect_symbol(text: str) -> str | None:
     """Extract the first trading symbol from user text."""
-    lower = text.lower()
-    for alias, sym in _ALIASES.items():
-        if alias in lower:
-            return sym
+    alias = min(
+        (m.group(1) for m in _ALIAS_RE.finditer(text.lower())),
+        key=_ALIAS_RANK.__getitem__,
+        default=None,
+    )
+    if alias:
+        return _ALIASES[alias]
 
-    match = _SYMBOL_RE.search(text)
+    match = _SYMBOL_RE.search(text.upper())
     if match:
-        return match.group(1).replace("/", "").replace("-", "").upper()
+        return match.group(1) + match.group(2)
 
     return None
 
 
 # ── Client ────────────────────────────────────────────────────────────────────
 
-def _get_client() -> OpenAI:
-    return OpenAI(
+# Built once so every call reuses the same httpx pool / keep-alive connection.
+# The SDK retries 429/5xx/connection errors with jittered exponential backoff
+# (honouring Retry-After); the semaphore keeps alert bursts from stampeding.
+@lru_cache(maxsize=1)
+def _get_client() -> AsyncOpenAI:
+    return AsyncOpenAI(
         api_key=settings.DEEPSEEK_API_KEY,
         base_url="https://api.deepseek.com",
+        max_retries=MAX_RETRIES,
     )
 
 
+_ai_sem = asyncio.Semaphore(MAX_CONCURRENT_AI_CALLS)
+
+
 # ── Core chat ─────────────────────────────────────────────────────────────────
 
-def chat(messages: list[dict[str, str]], price_context: str | None = None) -> str:
-    """Multi-turn AI chat. Optionally inject live price context."""
-    system = SYSTEM_PROMPT
+def _chat_messages(
+    messages: list[dict[str, str]], price_context: str | None
+) -> list[dict[str, str]]:
+    # SYSTEM_PROMPT goes out verbatim as its own message so every request shares
+    # the same prefix for DeepSeek's context cache; live data follows separately
+    head = [{"role": "system", "content": SYSTEM_PROMPT}]
     if price_context:
-        system = SYSTEM_PROMPT + f"\n\nLIVE MARKET DATA (use this — do not use training data prices):\n{price_context}"
+        head.append({
+            "role": "system",
+            "content": f"LIVE MARKET DATA (use this — do not use training data prices):\n{price_context}",
+        })
+    return head + messages
 
-    response = _get_client().chat.completions.create(
-        model=MODEL,
-        max_tokens=700,
-        messages=[{"role": "system", "content": system}] + messages,
-    )
+
+async def chat(messages: list[dict[str, str]], price_context: str | None = None) -> str:
+    """Multi-turn AI chat. Optionally inject live price context."""
+    async with _ai_sem:
+        response = await _get_client().chat.completions.create(
+            model=MODEL,
+            max_tokens=700,
+            messages=_chat_messages(messages, price_context),
+        )
     return response.choices[0].message.content or ""
 
 
+async def chat_stream(
+    messages: list[dict[str, str]], price_context: str | None = None
+) -> AsyncIterator[str]:
+    """Same as chat() but yields text deltas as DeepSeek produces them."""
+    async with _ai_sem:
+        stream = await _get_client().chat.completions.create(
+            model=MODEL,
+            max_tokens=700,
+            messages=_chat_messages(messages, price_context),
+            stream=True,
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
 # ── Alert summary ─────────────────────────────────────────────────────────────
 
-def generate_alert_summary(symbol: str, price: float, alert_type: str, target: float) -> str:
+_ALERT_PROMPT = (
+    "Alert fired: {symbol} is NOW at {price:.5f} "
+    "(alert type: {alert_type}, target level: {target:.5f}). "
+    "Give a 2-3 sentence market context. Current price is {price:.5f} — base your analysis on this exact level."
+)
+
+
+async def generate_alert_summary(symbol: str, price: float, alert_type: str, target: float) -> str:
     """Generate a brief AI market summary when an alert fires."""
-    prompt = (
-        f"Alert fired: {symbol} is NOW at {price:.5f} "
-        f"(alert type: {alert_type}, target level: {target:.5f}). "
-        f"Give a 2-3 sentence market context. Current price is {price:.5f} — base your analysis on this exact level."
-    )
-    response = _get_client().chat.completions.create(
-        model=MODEL,
-        max_tokens=180,
-        messages=[
-            {"role": "system", "content": ALERT_SYSTEM_PROMPT},
-            {"role": "user", "content": prompt},
-        ],
-    )
+    prompt = _ALERT_PROMPT.format(symbol=symbol, price=price, alert_type=alert_type, target=target)
+    async with _ai_sem:
+        response = await _get_client().chat.completions.create(
+            model=MODEL,
+            max_tokens=180,
+            messages=[
+                {"role": "system", "content": ALERT_SYSTEM_PROMPT},
+                {"role": "user", "content": prompt},
+            ],
+        )
     return response.choices[0].message.content or ""
 
 
@@ -138,7 +192,7 @@ Extract the reminder details and return ONLY valid JSON with these fields:
 - "session_type": string or null — one of "asian", "london", "new_york" if it's a session reminder, else null
 - "is_recurring": boolean — true if they want it daily (sessions are always recurring)
 
-Current UTC time: {now_utc}
+The current UTC time is given at the top of the user's message.
 
 Session open times (UTC):
 - Asian session: 00:00 UTC
@@ -152,24 +206,21 @@ Rules:
 - Always return valid JSON only — no explanation, no markdown fences"""
 
 
-def parse_reminder(user_text: str, now_utc: str) -> dict | None:
+async def parse_reminder(user_text: str, now_utc: str) -> dict | None:
     """Parse a natural-language reminder request into structured data."""
-    import json
-    prompt = REMINDER_PARSE_PROMPT.format(now_utc=now_utc)
+    # The system prompt stays byte-identical across calls so DeepSeek's prefix
+    # cache can reuse it; the per-call clock goes in the user turn
     try:
-        response = _get_client().chat.completions.create(
-            model=MODEL,
-            max_tokens=200,
-            messages=[
-                {"role": "system", "content": prompt},
-                {"role": "user", "content": user_text},
-            ],
-        )
-        raw = (response.choices[0].message.content or "").strip()
-        if raw.startswith("```"):
-            raw = raw.split("```")[1]
-            if raw.startswith("json"):
-                raw = raw[4:]
-        return json.loads(raw.strip())
+        async with _ai_sem:
+            response = await _get_client().chat.completions.create(
+                model=MODEL,
+                max_tokens=200,
+                messages=[
+                    {"role": "system", "content": REMINDER_PARSE_PROMPT},
+                    {"role": "user", "content": f"Current UTC time: {now_utc}\n\nRequest: {user_text}"},
+                ],
+                response_format={"type": "json_object"},
+            )
+        return orjson.loads(response.choices[0].message.content or "")
     except Exception:
         return None
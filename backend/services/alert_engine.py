@@ -1,22 +1,31 @@
 """Alert trigger logic: Touch, Cross, Near, Zone."""
 
+import asyncio
 import logging
+import math
+import re
+import time
+from bisect import bisect_left
 from datetime import datetime, timezone
+from functools import lru_cache
 from typing import Any
 
-from supabase import create_client
+import numpy as np
+from cachetools import TTLCache
 
-from core.config import settings
+from core.db import get_supabase
 
 logger = logging.getLogger(__name__)
 
 
+# JPY pairs, crypto and gold quote in cents; everything else in 1/10000
+_CENT_PIP_RE = re.compile("JPY|BTC|ETH|XRP|GOLD|XAU")
+
+
+# The symbol universe is small, so each symbol's scan runs once per process
+@lru_cache(maxsize=256)
 def _pip_size(symbol: str) -> float:
-    if "JPY" in symbol:
-        return 0.01
-    if any(c in symbol for c in ("BTC", "ETH", "XRP", "GOLD", "XAU")):
-        return 0.01
-    return 0.0001
+    return 0.01 if _CENT_PIP_RE.search(symbol) else 0.0001
 
 
 def _is_triggered(
@@ -24,164 +33,471 @@ def _is_triggered(
     price: float,
     prev_price: float | None = None,
 ) -> bool:
-    """Return True if the current (or crossed) price satisfies the alert condition."""
-    target: float = float(alert["price"])
-    direction: str | None = alert.get("direction")
-    alert_type: str = alert["alert_type"]
-    pip_buf: float = float(alert.get("pip_buffer") or 5)
-    pip: float = _pip_size(alert["symbol"])
-    buffer: float = pip_buf * pip
-
-    match alert_type:
-        case "touch":
-            if direction == "above":
-                # Fires when price reaches or crosses target from below
-                hit = price >= target
-                # Also catch if price jumped over target between polls
-                crossed = (
-                    prev_price is not None
-                    and prev_price < target
-                    and price > target
-                )
-                return hit or crossed
-
-            if direction == "below":
-                hit = price <= target
-                crossed = (
-                    prev_price is not None
-                    and prev_price > target
-                    and price < target
-                )
-                return hit or crossed
-
-            # No direction — fire when price is within buffer OR crossed the target
-            within = abs(price - target) <= buffer
-            crossed = prev_price is not None and (
-                (prev_price < target <= price) or
-                (prev_price > target >= price)
+    """Return True if the current (or crossed) price satisfies the alert condition.
+
+    Expects a row prepared by _precoerce: branches on int codes, no casts.
+    """
+    kind: int = alert["_type"]
+    direction: int = alert["_direction"]
+    target: float = alert["_target"]
+
+    if kind == 0:  # touch
+        if direction == 1:
+            # Fires when price reaches or crosses target from below
+            hit = price >= target
+            # Also catch if price jumped over target between polls
+            crossed = (
+                prev_price is not None
+                and prev_price < target
+                and price > target
             )
-            return within or crossed
-
-        case "cross":
-            if direction == "above":
-                # Strict cross: previous price must have been below
-                if prev_price is not None:
-                    return prev_price < target <= price
-                return price >= target
-            if direction == "below":
-                if prev_price is not None:
-                    return prev_price > target >= price
-                return price <= target
-            return False
-
-        case "near":
-            return abs(price - target) <= buffer
-
-        case "zone":
-            zone_high = alert.get("zone_high")
-            if zone_high is None:
-                return False
-            low, high = float(target), float(zone_high)
-            # Current price inside zone
-            if low <= price <= high:
-                return True
-            # Price crossed into zone between polls
+            return hit or crossed
+
+        if direction == -1:
+            hit = price <= target
+            crossed = (
+                prev_price is not None
+                and prev_price > target
+                and price < target
+            )
+            return hit or crossed
+
+        # No direction — fire when price is within buffer OR crossed the target
+        within = abs(price - target) <= alert["_buffer"]
+        crossed = prev_price is not None and (
+            (prev_price < target <= price) or
+            (prev_price > target >= price)
+        )
+        return within or crossed
+
+    if kind == 1:  # cross
+        if direction == 1:
+            # Strict cross: previous price must have been below
+            if prev_price is not None:
+                return prev_price < target <= price
+            return price >= target
+        if direction == -1:
             if prev_price is not None:
-                return (prev_price < low <= price) or (prev_price > high >= price)
+                return prev_price > target >= price
+            return price <= target
+        return False
+
+    if kind == 2:  # near
+        return abs(price - target) <= alert["_buffer"]
+
+    if kind == 3:  # zone
+        high: float = alert["_zone_high"]
+        if math.isnan(high):
             return False
+        low = target
+        # Current price inside zone
+        if low <= price <= high:
+            return True
+        # Price crossed into zone between polls
+        if prev_price is not None:
+            return (prev_price < low <= price) or (prev_price > high >= price)
+        return False
 
     return False
 
 
-async def check_alerts(
-    quotes: dict[str, dict[str, Any]],
-    prev_quotes: dict[str, dict[str, Any]] | None = None,
-) -> None:
-    """Evaluate all active alerts against the latest quotes, fire triggers."""
-    supabase = create_client(settings.SUPABASE_URL, settings.SUPABASE_SERVICE_KEY)
+# ── Vectorized evaluation ─────────────────────────────────────────────────────
+# Same rules as _is_triggered, evaluated for every alert at once. NaN stands in
+# for "no price" / "no previous price": every comparison against NaN is False.
+
+_TYPE_CODES = {"touch": 0, "cross": 1, "near": 2, "zone": 3}
+_DIRECTION_CODES = {"above": 1, "below": -1}
+
+# Below this many rows, array setup costs more than the scalar loop
+VECTOR_MIN_ALERTS = 32
+
+
+def _precoerce(alerts: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Attach numeric fields to each row once, so evaluation skips casts and lookups."""
+    for alert in alerts:
+        zone_high = alert.get("zone_high")
+        alert["_type"] = _TYPE_CODES.get(alert["alert_type"], -1)
+        alert["_direction"] = _DIRECTION_CODES.get(alert.get("direction"), 0)
+        alert["_target"] = float(alert["price"])
+        alert["_zone_high"] = float(zone_high) if zone_high is not None else math.nan
+        alert["_buffer"] = float(alert.get("pip_buffer") or 5) * _pip_size(alert["symbol"])
+    return alerts
+
+
+def quote_prices(quotes: dict[str, dict[str, Any]]) -> dict[str, float]:
+    """symbol → price for usable (positive) quotes."""
+    prices: dict[str, float] = {}
+    for sym, q in quotes.items():
+        price = float(q.get("price", 0))
+        if price > 0:
+            prices[sym] = price
+    return prices
+
+
+def _alert_arrays(
+    alerts: list[dict[str, Any]],
+    prices: dict[str, float],
+    prev_prices: dict[str, float],
+) -> dict[str, np.ndarray]:
+    """Column arrays for _triggered_mask from pre-coerced rows + per-symbol prices."""
+    n = len(alerts)
+    nan = math.nan
+
+    def col(values, dtype=np.float64) -> np.ndarray:
+        return np.fromiter(values, dtype, n)
+
+    return {
+        "type": col((a["_type"] for a in alerts), np.int8),
+        "direction": col((a["_direction"] for a in alerts), np.int8),
+        "target": col(a["_target"] for a in alerts),
+        "zone_high": col(a["_zone_high"] for a in alerts),
+        "buffer": col(a["_buffer"] for a in alerts),
+        "price": col(prices.get(a["symbol"], nan) for a in alerts),
+        "prev": col(prev_prices.get(a["symbol"], nan) for a in alerts),
+    }
+
+
+def _triggered_mask(cols: dict[str, np.ndarray]) -> np.ndarray:
+    """Boolean mask of alerts whose condition is met."""
+    kind, direction = cols["type"], cols["direction"]
+    target, price, prev = cols["target"], cols["price"], cols["prev"]
+    zone_high = cols["zone_high"]
+
+    # direction doubles as a sign (+1 above, -1 below): "reached the target on
+    # the alert's side" is then one compare for both directions
+    signed = (price - target) * direction
+    signed_prev = (prev - target) * direction
+    directional = direction != 0
+    reached = directional & (signed >= 0)
+    within = np.abs(price - target) <= cols["buffer"]
+
+    # Undirected touch: within buffer, or prev and price straddle the target
+    # (price == target is already covered by within)
+    touch = reached | (~directional & (within | ((prev - target) * (price - target) < 0)))
+    # Cross: reached now and was short of the target last poll (NaN prev → fires)
+    cross = reached & ~(signed_prev >= 0)
+    zone = ~np.isnan(zone_high) & (
+        ((target <= price) & (price <= zone_high))
+        | ((prev < target) & (target <= price))
+        | ((prev > zone_high) & (zone_high >= price))
+    )
+
+    return (
+        ((kind == 0) & touch)
+        | ((kind == 1) & cross)
+        | ((kind == 2) & within)
+        | ((kind == 3) & zone)
+    )
 
-    symbols = list(quotes.keys())
-    result = (
-        supabase.table("alerts")
-        .select("*, profiles(tier, whatsapp, telegram_id, email)")
+
+def _find_triggered(
+    alerts: list[dict[str, Any]],
+    prices: dict[str, float],
+    prev_prices: dict[str, float],
+) -> list[tuple[dict[str, Any], float, float | None]]:
+    """(alert, price, prev_price) for every alert whose condition is met."""
+    if len(alerts) < VECTOR_MIN_ALERTS:
+        hits = []
+        for alert in alerts:
+            price = prices.get(alert["symbol"])
+            if price is None:
+                continue
+            prev_price = prev_prices.get(alert["symbol"])
+            if _is_triggered(alert, price, prev_price):
+                hits.append((alert, price, prev_price))
+        return hits
+
+    cols = _alert_arrays(alerts, prices, prev_prices)
+    prev_col = cols["prev"]
+    return [
+        (
+            alerts[i],
+            float(cols["price"][i]),
+            None if np.isnan(prev_col[i]) else float(prev_col[i]),
+        )
+        for i in np.flatnonzero(_triggered_mask(cols))
+    ]
+
+
+# ── Profiles ──────────────────────────────────────────────────────────────────
+# Alert rows are fetched without the profiles embed; only the owners of alerts
+# that actually fire are looked up, and recent lookups are reused.
+
+PROFILE_TTL = 60  # seconds
+
+_profile_cache: TTLCache[str, dict[str, Any]] = TTLCache(maxsize=10_000, ttl=PROFILE_TTL)
+
+
+async def _attach_profiles(alerts: list[dict[str, Any]]) -> None:
+    """Set alert["profiles"] (tier + contact fields) for each triggered row."""
+    missing = list({a["user_id"] for a in alerts} - _profile_cache.keys())
+    if missing:
+        q = (
+            get_supabase().table("profiles")
+            .select("id, tier, whatsapp, telegram_id, email")
+            .in_("id", missing)
+        )
+        result = await asyncio.to_thread(q.execute)
+        for profile in result.data or []:
+            # Stored as text; parsed once here so sends hand aiogram an int chat_id
+            telegram_id = profile.get("telegram_id")
+            if telegram_id:
+                try:
+                    profile["telegram_id"] = int(telegram_id)
+                except ValueError:
+                    pass
+            _profile_cache[profile["id"]] = profile
+    for alert in alerts:
+        alert["profiles"] = _profile_cache.get(alert["user_id"]) or {}
+
+
+# ── Active-alert cache ────────────────────────────────────────────────────────
+# Regular and correlation alerts are loaded once and reused across ticks; the
+# alert CRUD paths call invalidate_alert_cache(), and the TTL bounds staleness
+# from edits made outside this process.
+
+ALERT_CACHE_TTL = 120  # seconds
+
+_alert_cache: dict[str, list[dict[str, Any]]] | None = None  # symbol → rows
+_alert_cache_loaded_at = 0.0
+_alert_cache_gen = 0  # bumped on invalidation so an in-flight load isn't kept
+
+_corr_cache: list[dict[str, Any]] | None = None
+_corr_cache_loaded_at = 0.0
+
+# Notified but not yet marked in the DB (the mark RPC failed). Kept out of
+# every reload so they can't notify twice; the mark is retried each tick.
+_unmarked: set[str] = set()
+_unmarked_corr: dict[str, str] = {}  # correlation alert id → triggering symbol
+
+
+def invalidate_alert_cache() -> None:
+    """Force the next check to reload active (and correlation) alerts from the database."""
+    global _alert_cache, _corr_cache, _alert_cache_gen
+    _alert_cache = None
+    _corr_cache = None
+    _alert_cache_gen += 1
+
+
+async def _load_active_alerts() -> dict[str, list[dict[str, Any]]]:
+    q = (
+        get_supabase().table("alerts")
+        .select("id, user_id, symbol, alert_type, direction, price, pip_buffer, zone_high")
         .eq("is_active", True)
         .is_("triggered_at", "null")
-        .in_("symbol", symbols)
-        .execute()
     )
-
-    if not result.data:
+    result = await asyncio.to_thread(q.execute)
+    by_symbol: dict[str, list[dict[str, Any]]] = {}
+    rows = [a for a in result.data or [] if a["id"] not in _unmarked]
+    for alert in _precoerce(rows):
+        by_symbol.setdefault(alert["symbol"], []).append(alert)
+    return by_symbol
+
+
+async def active_alerts() -> dict[str, list[dict[str, Any]]]:
+    """Active, untriggered alerts grouped by symbol (rows already pre-coerced)."""
+    global _alert_cache, _alert_cache_loaded_at
+    if _alert_cache is not None and time.monotonic() - _alert_cache_loaded_at <= ALERT_CACHE_TTL:
+        return _alert_cache
+    gen = _alert_cache_gen
+    loaded = await _load_active_alerts()
+    if gen == _alert_cache_gen:
+        _alert_cache, _alert_cache_loaded_at = loaded, time.monotonic()
+    _index_levels(loaded)
+    return loaded
+
+
+def _drop_cached(alert_ids: list[str]) -> None:
+    if _alert_cache is None:
         return
+    fired = set(alert_ids)
+    for sym, rows in list(_alert_cache.items()):
+        kept = [a for a in rows if a["id"] not in fired]
+        if kept:
+            _alert_cache[sym] = kept
+        else:
+            del _alert_cache[sym]
+
+
+async def active_correlation_alerts() -> list[dict[str, Any]]:
+    """Active, untriggered correlation alerts."""
+    global _corr_cache, _corr_cache_loaded_at
+    if _corr_cache is not None and time.monotonic() - _corr_cache_loaded_at <= ALERT_CACHE_TTL:
+        return _corr_cache
+    gen = _alert_cache_gen
+    q = (
+        get_supabase().table("correlation_alerts")
+        .select("id, user_id, symbol1, symbol2, zone_low, zone_high")
+        .eq("is_active", True)
+        .is_("triggered_at", "null")
+    )
+    result = await asyncio.to_thread(q.execute)
+    rows = [a for a in result.data or [] if a["id"] not in _unmarked_corr]
+    if gen == _alert_cache_gen:
+        _corr_cache, _corr_cache_loaded_at = rows, time.monotonic()
+    return rows
 
-    triggered_ids: list[str] = []
-    notifications: list[dict[str, Any]] = []
 
-    for alert in result.data:
-        symbol = alert["symbol"]
-        quote = quotes.get(symbol)
-        if not quote:
-            continue
+def _drop_cached_correlation(alert_ids: list[str]) -> None:
+    global _corr_cache
+    if _corr_cache is not None:
+        fired = set(alert_ids)
+        _corr_cache = [a for a in _corr_cache if a["id"] not in fired]
 
-        price: float = float(quote.get("price", 0))
-        if price <= 0:
-            continue
 
-        # Previous price for crossing detection
-        prev_price: float | None = None
-        if prev_quotes and symbol in prev_quotes:
-            prev_price = float(prev_quotes[symbol].get("price", 0)) or None
+async def _mark_triggered(alert_ids: list[str]) -> None:
+    now = datetime.now(timezone.utc).isoformat()
+    q = get_supabase().rpc("mark_alerts_triggered", {"ids": alert_ids, "fired_at": now})
+    try:
+        await asyncio.to_thread(q.execute)
+    except Exception as exc:
+        _unmarked.update(alert_ids)
+        logger.error("Failed to mark %d alert(s) triggered: %s — retrying next tick", len(alert_ids), exc)
+    else:
+        _unmarked.difference_update(alert_ids)
 
-        if _is_triggered(alert, price, prev_price):
-            triggered_ids.append(alert["id"])
-            notifications.append({
-                "alert": alert,
-                "price": price,
-                "symbol": symbol,
-            })
-            logger.info(
-                "TRIGGERED: %s %s @ %.5f (target=%.5f prev=%s type=%s)",
-                alert["alert_type"],
-                symbol,
-                price,
-                float(alert["price"]),
-                f"{prev_price:.5f}" if prev_price else "n/a",
-                alert["alert_type"],
+
+async def _mark_correlation_triggered(fired: dict[str, str]) -> None:
+    now = datetime.now(timezone.utc).isoformat()
+    q = get_supabase().rpc(
+        "mark_correlation_triggered",
+        {"ids": list(fired), "syms": list(fired.values()), "fired_at": now},
+    )
+    try:
+        await asyncio.to_thread(q.execute)
+    except Exception as exc:
+        _unmarked_corr.update(fired)
+        logger.error(
+            "Failed to mark %d correlation alert(s) triggered: %s — retrying next tick", len(fired), exc
+        )
+    else:
+        for alert_id in fired:
+            _unmarked_corr.pop(alert_id, None)
+
+
+# ── Quote delta gate ──────────────────────────────────────────────────────────
+# Every condition flips only where price meets a level: a target, target ±
+# buffer, or a zone high. If a symbol's alerts were all evaluated last tick
+# without anything left pending and no level lies between the previous and
+# current price, nothing on that symbol can fire now.
+
+_alert_levels: dict[str, list[float]] = {}  # symbol → sorted levels
+_quiet_symbols: set[str] = set()  # evaluated on the last tick, nothing pending
+
+
+def _index_levels(by_symbol: dict[str, list[dict[str, Any]]]) -> None:
+    global _alert_levels
+    _alert_levels = {
+        sym: sorted(
+            level
+            for a in rows
+            for level in (
+                a["_target"] - a["_buffer"],
+                a["_target"],
+                a["_target"] + a["_buffer"],
+                a["_zone_high"],
             )
+            if not math.isnan(level)
+        )
+        for sym, rows in by_symbol.items()
+    }
+    # Freshly loaded rows haven't been evaluated yet
+    _quiet_symbols.clear()
 
-    if not triggered_ids:
+
+def _can_skip(symbol: str, price: float, prev_price: float | None) -> bool:
+    if prev_price is None or symbol not in _quiet_symbols:
+        return False
+    levels = _alert_levels.get(symbol)
+    if levels is None:
+        return False
+    lo, hi = (prev_price, price) if prev_price <= price else (price, prev_price)
+    i = bisect_left(levels, lo)
+    return i == len(levels) or levels[i] > hi
+
+
+async def check_alerts(
+    prices: dict[str, float],
+    prev_prices: dict[str, float] | None = None,
+) -> None:
+    """Evaluate all active alerts against the latest prices, fire triggers."""
+    if _unmarked:
+        await _mark_triggered(list(_unmarked))
+    by_symbol = await active_alerts()
+    prev_prices = prev_prices or {}
+    symbols = [
+        sym for sym, price in prices.items()
+        if sym in by_symbol and not _can_skip(sym, price, prev_prices.get(sym))
+    ]
+    # Not quiet again until this tick has fully handled them
+    _quiet_symbols.difference_update(symbols)
+    alerts = [a for sym in symbols for a in by_symbol[sym]]
+    if not alerts:
         return
 
-    now = datetime.now(timezone.utc).isoformat()
-    supabase.table("alerts").update(
-        {"triggered_at": now, "is_active": False}
-    ).in_("id", triggered_ids).execute()
+    hits = _find_triggered(alerts, prices, prev_prices)
+    if not hits:
+        _quiet_symbols.update(symbols)
+        return
+
+    triggered_ids: list[str] = []
+    notifications: list[dict[str, Any]] = []
+
+    for alert, price, prev_price in hits:
+        symbol = alert["symbol"]
+        triggered_ids.append(alert["id"])
+        notifications.append({
+            "alert": alert,
+            "price": price,
+            "target": alert["_target"],
+            "symbol": symbol,
+        })
+        logger.info(
+            "TRIGGERED: %s %s @ %.5f (target=%.5f prev=%s type=%s)",
+            alert["alert_type"],
+            symbol,
+            price,
+            alert["_target"],
+            "n/a" if prev_price is None else f"{prev_price:.5f}",
+            alert["alert_type"],
+        )
+
+    await _attach_profiles([n["alert"] for n in notifications])
 
     from services.notifier import dispatch_notifications
-    await dispatch_notifications(notifications)
+
+    # The DB write and the sends don't depend on each other, so they overlap.
+    # Once sent, an alert is never evaluated again — a failed mark is retried
+    # on its own, not by firing the alert a second time.
+    _, dispatched = await asyncio.gather(
+        _mark_triggered(triggered_ids),
+        dispatch_notifications(notifications),
+        return_exceptions=True,
+    )
+    _drop_cached(triggered_ids)
+    _quiet_symbols.update(symbols)
+    if isinstance(dispatched, BaseException):
+        raise dispatched
 
 
 async def check_correlation_alerts(
-    quotes: dict[str, dict[str, Any]],
-    prev_quotes: dict[str, dict[str, Any]] | None = None,
+    alerts: list[dict[str, Any]],
+    prices: dict[str, float],
+    prev_prices: dict[str, float] | None = None,
 ) -> None:
     """Check active correlation zone alerts — fires when either pair enters the zone."""
-    supabase = create_client(settings.SUPABASE_URL, settings.SUPABASE_SERVICE_KEY)
-
-    result = (
-        supabase.table("correlation_alerts")
-        .select("*, profiles(tier, telegram_id, whatsapp, email)")
-        .eq("is_active", True)
-        .is_("triggered_at", "null")
-        .execute()
-    )
-    if not result.data:
+    if _unmarked_corr:
+        await _mark_correlation_triggered(dict(_unmarked_corr))
+    if not alerts:
         return
 
+    prev_prices = prev_prices or {}
+
     triggered_ids: list[str] = []
-    updates: list[tuple[str, str]] = []  # (id, triggered_by)
+    triggered_syms: list[str] = []
     notifications: list[dict[str, Any]] = []
 
-    for alert in result.data:
+    for alert in alerts:
         sym1: str = alert["symbol1"]
         sym2: str = alert["symbol2"]
         zone_low: float = float(alert["zone_low"])
@@ -191,15 +507,10 @@ async def check_correlation_alerts(
         triggered_price: float | None = None
 
         for sym in (sym1, sym2):
-            q = quotes.get(sym)
-            if not q:
-                continue
-            price = float(q.get("price", 0))
-            if price <= 0:
+            price = prices.get(sym)
+            if price is None:
                 continue
-            prev_price: float | None = None
-            if prev_quotes and sym in prev_quotes:
-                prev_price = float(prev_quotes[sym].get("price", 0)) or None
+            prev_price = prev_prices.get(sym)
 
             in_zone = zone_low <= price <= zone_high
             crossed = prev_price is not None and (
@@ -213,7 +524,7 @@ async def check_correlation_alerts(
 
         if triggered_by and triggered_price is not None:
             triggered_ids.append(alert["id"])
-            updates.append((alert["id"], triggered_by))
+            triggered_syms.append(triggered_by)
             notifications.append({
                 "alert": alert,
                 "symbol": triggered_by,
@@ -227,11 +538,15 @@ async def check_correlation_alerts(
     if not triggered_ids:
         return
 
-    now = datetime.now(timezone.utc).isoformat()
-    for alert_id, trig_sym in updates:
-        supabase.table("correlation_alerts").update(
-            {"triggered_at": now, "is_active": False, "triggered_by": trig_sym}
-        ).eq("id", alert_id).execute()
+    await _attach_profiles([n["alert"] for n in notifications])
 
     from services.notifier import dispatch_correlation_notifications
-    await dispatch_correlation_notifications(notifications)
+
+    _, dispatched = await asyncio.gather(
+        _mark_correlation_triggered(dict(zip(triggered_ids, triggered_syms))),
+        dispatch_correlation_notifications(notifications),
+        return_exceptions=True,
+    )
+    _drop_cached_correlation(triggered_ids)
+    if isinstance(dispatched, BaseException):
+        raise dispatched
@@ -5,8 +5,10 @@ From address: alerts@yourdomain.com (must be a verified Resend domain).
 """
 
 import logging
+from html import escape
 
 import httpx
+import orjson
 
 from core.config import settings
 
@@ -15,30 +17,15 @@ logger = logging.getLogger(__name__)
 RESEND_URL = "https://api.resend.com/emails"
 FROM_ADDRESS = "MarketWatch AI <alerts@marketwatchai.com>"
 
+_TYPE_LABELS = {
+    "touch": "touched",
+    "cross": "crossed",
+    "near": "is near",
+    "zone": "entered your zone at",
+}
 
-async def send_alert_email(
-    to: str,
-    symbol: str,
-    alert_type: str,
-    price: float,
-    target: float,
-    ai_summary: str,
-) -> None:
-    """Send a price alert email. No-ops silently if RESEND_API_KEY is not set."""
-    if not settings.RESEND_API_KEY:
-        logger.debug("RESEND_API_KEY not set — skipping email alert for %s", to)
-        return
-
-    type_labels = {
-        "touch": "touched",
-        "cross": "crossed",
-        "near": "is near",
-        "zone": "entered your zone at",
-    }
-    verb = type_labels.get(alert_type, "hit")
-
-    subject = f"🔔 {symbol} Alert — {alert_type.capitalize()} @ {price:.5f}"
-    html = f"""
+# Module-level template; symbol and the AI text are HTML-escaped before substitution
+_ALERT_HTML = """
     <div style="font-family:sans-serif;max-width:480px;margin:0 auto;padding:24px">
       <h2 style="color:#10b981;margin:0 0 8px">MarketWatch AI Alert</h2>
       <p style="color:#6b7280;margin:0 0 24px;font-size:14px">Price alert triggered</p>
@@ -60,7 +47,7 @@ async def send_alert_email(
         <p style="color:#d1d5db;font-size:14px;line-height:1.6;margin:0">{ai_summary}</p>
       </div>
 
-      <a href="{settings.FRONTEND_URL}/dashboard/alerts"
+      <a href="{frontend}/dashboard/alerts"
          style="display:inline-block;background:#10b981;color:#000;font-weight:600;
                 padding:12px 24px;border-radius:8px;text-decoration:none;font-size:14px">
         Manage Alerts →
@@ -68,20 +55,64 @@ async def send_alert_email(
 
       <p style="color:#374151;font-size:12px;margin-top:24px">
         You're receiving this because you have no Telegram or WhatsApp linked.<br>
-        <a href="{settings.FRONTEND_URL}/dashboard/settings" style="color:#10b981">
+        <a href="{frontend}/dashboard/settings" style="color:#10b981">
           Link Telegram to get faster alerts.
         </a>
       </p>
     </div>
-    """
+"""
+
+# Shared across sends so an alert burst reuses one connection to Resend
+_client: httpx.AsyncClient | None = None
+
+
+def _get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            http2=True,
+            timeout=10,
+            headers={"Content-Type": "application/json"},
+        )
+    return _client
+
+
+async def close_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def send_alert_email(
+    to: str,
+    symbol: str,
+    alert_type: str,
+    price: float,
+    target: float,
+    ai_summary: str,
+) -> None:
+    """Send a price alert email. No-ops silently if RESEND_API_KEY is not set."""
+    if not settings.RESEND_API_KEY:
+        logger.debug("RESEND_API_KEY not set — skipping email alert for %s", to)
+        return
+
+    subject = f"🔔 {symbol} Alert — {alert_type.capitalize()} @ {price:.5f}"
+    html = _ALERT_HTML.format(
+        symbol=escape(symbol),
+        verb=_TYPE_LABELS.get(alert_type, "hit"),
+        target=target,
+        price=price,
+        ai_summary=escape(ai_summary),
+        frontend=settings.FRONTEND_URL,
+    )
 
     try:
-        async with httpx.AsyncClient(timeout=10) as client:
-            resp = await client.post(
-                RESEND_URL,
-                headers={"Authorization": f"Bearer {settings.RESEND_API_KEY}"},
-                json={"from": FROM_ADDRESS, "to": [to], "subject": subject, "html": html},
-            )
+        resp = await _get_client().post(
+            RESEND_URL,
+            headers={"Authorization": f"Bearer {settings.RESEND_API_KEY}"},
+            content=orjson.dumps({"from": FROM_ADDRESS, "to": [to], "subject": subject, "html": html}),
+        )
         if resp.status_code not in (200, 201):
             logger.error("Resend email failed (%s): %s", resp.status_code, resp.text)
         else:
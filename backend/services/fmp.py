@@ -2,6 +2,7 @@ import logging
 from typing import Any
 
 import httpx
+import orjson
 
 from core.config import settings
 
@@ -12,6 +13,27 @@ logger = logging.getLogger(__name__)
 # symbols in the URL path — one API call regardless of how many symbols.
 FMP_V3 = "https://financialmodelingprep.com/api/v3"
 
+# One pooled client for every poll, so each tick reuses the warm TLS connection
+_client: httpx.AsyncClient | None = None
+
+
+def _get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            http2=True,
+            timeout=15,
+            limits=httpx.Limits(max_keepalive_connections=20, keepalive_expiry=60),
+        )
+    return _client
+
+
+async def close_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
 
 async def fetch_batch_quotes(symbols: list[str]) -> dict[str, dict[str, Any]]:
     """Fetch quotes for all symbols in a single FMP v3 batch call."""
@@ -20,19 +42,18 @@ async def fetch_batch_quotes(symbols: list[str]) -> dict[str, dict[str, Any]]:
 
     joined = ",".join(symbols)
     try:
-        async with httpx.AsyncClient(timeout=15) as client:
-            resp = await client.get(
-                f"{FMP_V3}/quote/{joined}",
-                params={"apikey": settings.FMP_API_KEY},
-            )
-            resp.raise_for_status()
-            data: list[dict[str, Any]] = resp.json()
-            if not data or not isinstance(data, list):
-                logger.warning("FMP v3 batch returned empty for: %s", joined)
-                return {}
-            result = {item["symbol"]: item for item in data if item.get("symbol")}
-            logger.debug("FMP v3 batch: got %d/%d symbols", len(result), len(symbols))
-            return result
+        resp = await _get_client().get(
+            f"{FMP_V3}/quote/{joined}",
+            params={"apikey": settings.FMP_API_KEY},
+        )
+        resp.raise_for_status()
+        data: list[dict[str, Any]] = orjson.loads(resp.content)
+        if not data or not isinstance(data, list):
+            logger.warning("FMP v3 batch returned empty for: %s", joined)
+            return {}
+        result = {item["symbol"]: item for item in data if item.get("symbol")}
+        logger.debug("FMP v3 batch: got %d/%d symbols", len(result), len(symbols))
+        return result
     except httpx.HTTPStatusError as exc:
         logger.error("FMP v3 HTTP %s for [%s]", exc.response.status_code, joined)
     except Exception as exc:
@@ -8,52 +8,99 @@ Each alert gets a Claude AI summary injected into the message.
 
 import asyncio
 import logging
-from typing import Any
+from collections.abc import Awaitable
+from typing import Any, TypeVar
+
+from cachetools import TTLCache
 
 from services.ai import generate_alert_summary
 from services.email import send_alert_email
-from services.telegram_service import send_alert as telegram_send, send_correlation_alert
+from services.telegram_service import (
+    send_alert as telegram_send,
+    send_alert_batch as telegram_send_batch,
+    send_correlation_alert,
+)
 from services.whatsapp_service import send_alert_template as whatsapp_send
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+SUMMARY_TTL = 60  # seconds
+MAX_SUMMARY_CHARS = 800  # keeps a single Telegram alert well under its 4096-char cap
+MAX_CONCURRENT_SENDS = 32  # outbound channel calls in flight (Telegram allows ~30 msg/s)
+
+_send_sem = asyncio.Semaphore(MAX_CONCURRENT_SENDS)
+
+# (symbol, alert_type, price, target) → summary task. Alerts that fire on the
+# same level share one DeepSeek call, including calls still in flight.
+_summary_cache: TTLCache[tuple[str, str, float, float], asyncio.Task[str]] = TTLCache(
+    maxsize=512, ttl=SUMMARY_TTL
+)
+
+
+async def _alert_summary(symbol: str, price: float, alert_type: str, target: float) -> str:
+    key = (symbol, alert_type, round(price, 5), round(target, 5))
+    task = _summary_cache.get(key)
+    if task is None:
+        task = asyncio.create_task(generate_alert_summary(symbol, price, alert_type, target))
+        _summary_cache[key] = task
+    try:
+        return await asyncio.shield(task)
+    except Exception:
+        # Don't pin a failure for the whole TTL
+        if _summary_cache.get(key) is task:
+            del _summary_cache[key]
+        raise
+
+
+async def _bounded(send: Awaitable[T]) -> T:
+    async with _send_sem:
+        return await send
+
+
+async def _summary_for(item: dict[str, Any]) -> str:
+    """Summary for one alert, truncated once here for every channel it fans out to."""
+    alert = item["alert"]
+    symbol: str = item["symbol"]
+    price: float = item["price"]
+    alert_type: str = alert["alert_type"]
+    try:
+        summary = await _alert_summary(symbol, price, alert_type, item["target"])
+        return summary[:MAX_SUMMARY_CHARS]
+    except Exception as exc:
+        logger.warning("AI summary failed for %s: %s — using fallback", symbol, exc)
+        return f"{symbol} hit your {alert_type} level at {price:.5f}."
+
 
-async def _notify_single(item: dict[str, Any]) -> None:
+async def _notify_single(item: dict[str, Any], ai_summary: str, telegram: bool = True) -> None:
     alert = item["alert"]
     symbol: str = item["symbol"]
     price: float = item["price"]
-    target: float = float(alert["price"])
+    target: float = item["target"]
     alert_type: str = alert["alert_type"]
 
     profile: dict[str, Any] = alert.get("profiles") or {}
     tier: str = profile.get("tier", "free")
-    telegram_id: str | None = profile.get("telegram_id")
+    telegram_id: int | str | None = profile.get("telegram_id")
     whatsapp: str | None = profile.get("whatsapp")
     email: str | None = profile.get("email")
 
-    # Generate AI summary (runs in thread to avoid blocking event loop)
-    try:
-        ai_summary = await asyncio.to_thread(
-            generate_alert_summary, symbol, price, alert_type, target
-        )
-    except Exception as exc:
-        logger.warning("AI summary failed for %s: %s — using fallback", symbol, exc)
-        ai_summary = f"{symbol} hit your {alert_type} level at {price:.5f}."
-
     tasks: list[asyncio.coroutine] = []
 
-    # Telegram — all tiers
+    # Telegram — all tiers (batched chats are sent by dispatch_notifications)
     if telegram_id:
-        tasks.append(
-            telegram_send(
-                telegram_id=telegram_id,
-                symbol=symbol,
-                alert_type=alert_type,
-                price=price,
-                target=target,
-                ai_summary=ai_summary,
+        if telegram:
+            tasks.append(
+                telegram_send(
+                    telegram_id=telegram_id,
+                    symbol=symbol,
+                    alert_type=alert_type,
+                    price=price,
+                    target=target,
+                    ai_summary=ai_summary,
+                )
             )
-        )
     else:
         # No Telegram and no WhatsApp — fall back to email
         if not (tier in ("pro", "elite") and whatsapp) and email:
@@ -84,7 +131,7 @@ async def _notify_single(item: dict[str, Any]) -> None:
         )
 
     if tasks:
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+        results = await asyncio.gather(*map(_bounded, tasks), return_exceptions=True)
         for r in results:
             if isinstance(r, Exception):
                 logger.error("Notification dispatch error: %s", r)
@@ -104,7 +151,50 @@ async def dispatch_notifications(notifications: list[dict[str, Any]]) -> None:
     """Dispatch all triggered alerts concurrently."""
     if not notifications:
         return
-    await asyncio.gather(*[_notify_single(n) for n in notifications])
+    # All summaries resolve in one fan-out (same-level alerts share a call),
+    # then the channel sends go out together
+    summaries = await asyncio.gather(*[_summary_for(n) for n in notifications])
+
+    # A chat with several alerts firing this tick gets one combined Telegram
+    # message instead of one per alert (per-chat rate limit is ~1 msg/s)
+    by_chat: dict[int | str, list[int]] = {}
+    for i, n in enumerate(notifications):
+        telegram_id = (n["alert"].get("profiles") or {}).get("telegram_id")
+        if telegram_id:
+            by_chat.setdefault(telegram_id, []).append(i)
+    batched: set[int] = set()
+    batch_sends = []
+    for telegram_id, idxs in by_chat.items():
+        if len(idxs) < 2:
+            continue
+        batched.update(idxs)
+        batch_sends.append(_bounded(telegram_send_batch(telegram_id, [
+            (
+                notifications[i]["symbol"],
+                notifications[i]["alert"]["alert_type"],
+                notifications[i]["price"],
+                notifications[i]["target"],
+                summaries[i],
+            )
+            for i in idxs
+        ])))
+
+    results = await asyncio.gather(
+        *[
+            _notify_single(n, s, telegram=i not in batched)
+            for i, (n, s) in enumerate(zip(notifications, summaries))
+        ],
+        *batch_sends,
+        return_exceptions=True,
+    )
+    for r in results:
+        if isinstance(r, Exception):
+            logger.error("Notification dispatch error: %s", r)
+    logger.info(
+        "Dispatched %d alert(s); %d chat(s) got a combined Telegram message",
+        len(notifications),
+        len(batch_sends),
+    )
 
 
 async def dispatch_correlation_notifications(notifications: list[dict[str, Any]]) -> None:
@@ -117,13 +207,13 @@ async def dispatch_correlation_notifications(notifications: list[dict[str, Any]]
         triggered_by: str = item["symbol"]
         price: float = item["price"]
         profile: dict[str, Any] = alert.get("profiles") or {}
-        telegram_id: str | None = profile.get("telegram_id")
+        telegram_id: int | str | None = profile.get("telegram_id")
 
         if not telegram_id:
             logger.warning("No telegram_id for correlation alert user %s", alert.get("user_id"))
             return
 
-        await send_correlation_alert(
+        await _bounded(send_correlation_alert(
             telegram_id=telegram_id,
             symbol1=alert["symbol1"],
             symbol2=alert["symbol2"],
@@ -131,6 +221,6 @@ async def dispatch_correlation_notifications(notifications: list[dict[str, Any]]
             price=price,
             zone_low=float(alert["zone_low"]),
             zone_high=float(alert["zone_high"]),
-        )
+        ))
 
     await asyncio.gather(*[_notify_correlation(n) for n in notifications], return_exceptions=True)
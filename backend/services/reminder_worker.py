@@ -2,11 +2,10 @@
 
 import asyncio
 import logging
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 
-from supabase import create_client
-
-from core.config import settings
+from core.db import get_supabase
+from services.telegram_service import get_bot
 
 logger = logging.getLogger(__name__)
 
@@ -21,14 +20,12 @@ SESSION_TIMES: dict[str, tuple[int, int]] = {
 
 
 def _db():
-    return create_client(settings.SUPABASE_URL, settings.SUPABASE_SERVICE_KEY)
+    return get_supabase()
 
 
 async def _send_telegram(telegram_id: str, text: str) -> None:
-    import httpx
-    url = f"https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}/sendMessage"
-    async with httpx.AsyncClient(timeout=10) as client:
-        await client.post(url, json={"chat_id": telegram_id, "text": text, "parse_mode": "Markdown"})
+    # The alert bot's aiohttp session stays open, so reminders skip the handshake
+    await get_bot().send_message(chat_id=telegram_id, text=text, parse_mode="Markdown")
 
 
 async def _fire_reminder(reminder: dict, telegram_id: str | None) -> None:
@@ -50,34 +47,46 @@ async def _process_due_reminders() -> None:
     now_iso = datetime.now(timezone.utc).isoformat()
 
     # Fetch due, unsent reminders with profile telegram_id
-    result = (
+    q = (
         db.table("reminders")
         .select("*, profiles(telegram_id)")
         .lte("remind_at", now_iso)
         .eq("sent", False)
-        .execute()
     )
+    result = await asyncio.to_thread(q.execute)
     rows = result.data or []
     if not rows:
         return
 
     logger.info("Firing %d due reminder(s)", len(rows))
 
+    sent_ids: list[str] = []
+    # Recurring session reminders share a next-fire time per session, so they
+    # move in at most one update per session instead of one per row
+    reschedule: dict[str, list[str]] = {}
+
     for r in rows:
         profile = r.get("profiles") or {}
         telegram_id = profile.get("telegram_id")
         await _fire_reminder(r, telegram_id)
 
         if r.get("is_recurring") and r.get("session_type"):
-            # Re-schedule for next day at the same session time
-            h, m = SESSION_TIMES[r["session_type"]]
-            next_dt = datetime.now(timezone.utc).replace(hour=h, minute=m, second=0, microsecond=0)
-            # Advance by 1 day
-            from datetime import timedelta
-            next_dt = next_dt + timedelta(days=1)
-            db.table("reminders").update({"remind_at": next_dt.isoformat(), "sent": False}).eq("id", r["id"]).execute()
+            reschedule.setdefault(r["session_type"], []).append(r["id"])
         else:
-            db.table("reminders").update({"sent": True}).eq("id", r["id"]).execute()
+            sent_ids.append(r["id"])
+
+    now = datetime.now(timezone.utc)
+    queries = []
+    if sent_ids:
+        queries.append(db.table("reminders").update({"sent": True}).in_("id", sent_ids))
+    for session, ids in reschedule.items():
+        # Re-schedule for next day at the same session time
+        h, m = SESSION_TIMES[session]
+        next_dt = now.replace(hour=h, minute=m, second=0, microsecond=0) + timedelta(days=1)
+        queries.append(
+            db.table("reminders").update({"remind_at": next_dt.isoformat(), "sent": False}).in_("id", ids)
+        )
+    await asyncio.gather(*(asyncio.to_thread(q.execute) for q in queries))
 
 
 async def run_reminder_worker() -> None:
@@ -1,24 +1,78 @@
 """Telegram bot — send alert notifications using aiogram Bot API."""
 
+import asyncio
 import logging
+import random
+from functools import lru_cache
 
 from aiogram import Bot
 from aiogram.enums import ParseMode
+from aiogram.exceptions import (
+    TelegramAPIError,
+    TelegramBadRequest,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
 
 from core.config import settings
 
 logger = logging.getLogger(__name__)
 
+TELEGRAM_MAX_CHARS = 4096
+SEND_ATTEMPTS = 3
+MAX_RETRY_DELAY = 10  # seconds — longer flood waits are given up on, not slept through
+
+_TYPE_EMOJI = {"touch": "🎯", "cross": "⚡", "near": "📍", "zone": "📦"}
+
+_ALERT_TEMPLATE = (
+    "{emoji} *MarketWatch Alert Triggered*\n\n"
+    "*Symbol:* `{symbol}`\n"
+    "*Type:* {alert_type}\n"
+    "*Current Price:* `{price:.5f}`\n"
+    "*Target Level:* `{target:.5f}`\n\n"
+    "🤖 *AI Summary:*\n{ai_summary}"
+)
+
 _bot: Bot | None = None
 
 
 def get_bot() -> Bot:
+    """The process-wide Bot: webhook handlers, alerts and reminders share its session."""
     global _bot
     if _bot is None:
         _bot = Bot(token=settings.TELEGRAM_BOT_TOKEN)
     return _bot
 
 
+async def close_bot() -> None:
+    global _bot
+    if _bot is not None:
+        await _bot.session.close()
+        _bot = None
+
+
+async def _send_message(chat_id: int | str, text: str, parse_mode: str | None = None) -> None:
+    """send_message with retries on flood control (429) and network/5xx errors."""
+    bot = get_bot()
+    for attempt in range(SEND_ATTEMPTS - 1):
+        try:
+            await bot.send_message(chat_id=chat_id, text=text, parse_mode=parse_mode)
+            return
+        except TelegramRetryAfter as exc:
+            if exc.retry_after > MAX_RETRY_DELAY:
+                raise
+            delay = exc.retry_after
+        except (TelegramNetworkError, TelegramServerError):
+            delay = min(2 ** attempt * random.uniform(0.5, 1.5), MAX_RETRY_DELAY)
+        logger.warning("Telegram send to %s failed (attempt %d) — retrying in %.1fs",
+                       chat_id, attempt + 1, delay)
+        await asyncio.sleep(delay)
+    await bot.send_message(chat_id=chat_id, text=text, parse_mode=parse_mode)
+
+
+# Recipients of the same level get the same summary, so the body renders once
+@lru_cache(maxsize=256)
 def _format_alert_message(
     symbol: str,
     alert_type: str,
@@ -26,19 +80,26 @@ def _format_alert_message(
     target: float,
     ai_summary: str,
 ) -> str:
-    type_emoji = {"touch": "🎯", "cross": "⚡", "near": "📍", "zone": "📦"}.get(alert_type, "🔔")
-    return (
-        f"{type_emoji} *MarketWatch Alert Triggered*\n\n"
-        f"*Symbol:* `{symbol}`\n"
-        f"*Type:* {alert_type.upper()}\n"
-        f"*Current Price:* `{price:.5f}`\n"
-        f"*Target Level:* `{target:.5f}`\n\n"
-        f"🤖 *AI Summary:*\n{ai_summary}"
+    return _ALERT_TEMPLATE.format(
+        emoji=_TYPE_EMOJI.get(alert_type, "🔔"),
+        symbol=symbol,
+        alert_type=alert_type.upper(),
+        price=price,
+        target=target,
+        ai_summary=ai_summary,
     )
 
 
+def _is_parse_error(exc: TelegramAPIError) -> bool:
+    """Markdown rejected by Telegram — the only failure a plain-text resend can fix.
+
+    Unknown chats, blocked bots and exhausted retries fail the same way either way.
+    """
+    return isinstance(exc, TelegramBadRequest) and "can't parse entities" in exc.message
+
+
 async def send_alert(
-    telegram_id: str,
+    telegram_id: int | str,
     symbol: str,
     alert_type: str,
     price: float,
@@ -46,68 +107,127 @@ async def send_alert(
     ai_summary: str,
 ) -> bool:
     """Send a formatted alert message to a Telegram user."""
-    bot = get_bot()
     text = _format_alert_message(symbol, alert_type, price, target, ai_summary)
     try:
-        await bot.send_message(
-            chat_id=telegram_id,
-            text=text,
-            parse_mode=ParseMode.MARKDOWN,   # MARKDOWN not MARKDOWN_V2 — no escaping needed
-        )
+        # MARKDOWN not MARKDOWN_V2 — no escaping needed
+        await _send_message(telegram_id, text, ParseMode.MARKDOWN)
         logger.info("Telegram alert sent to %s for %s", telegram_id, symbol)
         return True
-    except Exception as exc:
+    except TelegramAPIError as exc:
         logger.error("Telegram send error to %s: %s", telegram_id, exc)
-        # Retry without any parse mode (plain text fallback)
-        try:
-            plain = (
-                f"Alert Triggered: {symbol} {alert_type.upper()}\n"
-                f"Price: {price:.5f}  Target: {target:.5f}\n\n{ai_summary}"
-            )
-            await bot.send_message(chat_id=telegram_id, text=plain)
-            return True
-        except Exception:
+        if not _is_parse_error(exc):
             return False
+    # Markdown in the summary broke — retry without any parse mode
+    plain = (
+        f"Alert Triggered: {symbol} {alert_type.upper()}\n"
+        f"Price: {price:.5f}  Target: {target:.5f}\n\n{ai_summary}"
+    )
+    try:
+        await _send_message(telegram_id, plain)
+        return True
+    except TelegramAPIError as exc:
+        logger.error("Telegram plain-text send error to %s: %s", telegram_id, exc)
+        return False
 
 
-async def send_correlation_alert(
-    telegram_id: str,
+def _chunk_blocks(header: str, blocks: list[str]) -> list[str]:
+    """Join blocks under header, splitting into messages that fit Telegram's limit."""
+    messages: list[str] = []
+    current = header
+    for block in blocks:
+        if len(current) + 2 + len(block) > TELEGRAM_MAX_CHARS:
+            messages.append(current)
+            current = block
+        else:
+            current += "\n\n" + block
+    messages.append(current)
+    return messages
+
+
+async def send_alert_batch(
+    telegram_id: int | str,
+    alerts: list[tuple[str, str, float, float, str]],
+) -> bool:
+    """Send several triggered alerts to one chat as a single message.
+
+    alerts: (symbol, alert_type, price, target, ai_summary) per triggered alert.
+    """
+    header = f"🔔 *{len(alerts)} MarketWatch Alerts Triggered*"
+    blocks = [
+        f"{_TYPE_EMOJI.get(alert_type, '🔔')} `{symbol}` — {alert_type.upper()}\n"
+        f"Price `{price:.5f}` · Target `{target:.5f}`\n"
+        f"🤖 {ai_summary}"
+        for symbol, alert_type, price, target, ai_summary in alerts
+    ]
+    try:
+        for text in _chunk_blocks(header, blocks):
+            await _send_message(telegram_id, text, ParseMode.MARKDOWN)
+        logger.info("Telegram batch of %d alerts sent to %s", len(alerts), telegram_id)
+        return True
+    except TelegramAPIError as exc:
+        logger.error("Telegram batch send error to %s: %s", telegram_id, exc)
+        if not _is_parse_error(exc):
+            return False
+    # Retry without any parse mode (plain text fallback)
+    plain = [
+        f"{symbol} {alert_type.upper()}\n"
+        f"Price: {price:.5f}  Target: {target:.5f}\n{ai_summary}"
+        for symbol, alert_type, price, target, ai_summary in alerts
+    ]
+    try:
+        for text in _chunk_blocks(f"{len(alerts)} Alerts Triggered", plain):
+            await _send_message(telegram_id, text)
+        return True
+    except TelegramAPIError as exc:
+        logger.error("Telegram plain-text batch error to %s: %s", telegram_id, exc)
+        return False
+
+
+# Every user watching the same zone gets the same text — render it once
+@lru_cache(maxsize=256)
+def _format_correlation_message(
     symbol1: str,
     symbol2: str,
     triggered_by: str,
     price: float,
     zone_low: float,
     zone_high: float,
-) -> bool:
-    """Send a correlation zone alert notification."""
+) -> str:
     other = symbol2 if triggered_by == symbol1 else symbol1
-    text = (
+    return (
         f"🔗 *Correlation Zone Alert!*\n\n"
         f"*Pair:* `{symbol1}` / `{symbol2}`\n"
         f"*Zone:* `{zone_low:.5f}` — `{zone_high:.5f}`\n\n"
         f"`{triggered_by}` entered the zone @ `{price:.5f}`\n\n"
         f"Watch `{other}` for follow-through."
     )
-    bot = get_bot()
+
+
+async def send_correlation_alert(
+    telegram_id: int | str,
+    symbol1: str,
+    symbol2: str,
+    triggered_by: str,
+    price: float,
+    zone_low: float,
+    zone_high: float,
+) -> bool:
+    """Send a correlation zone alert notification."""
+    text = _format_correlation_message(symbol1, symbol2, triggered_by, price, zone_low, zone_high)
     try:
-        await bot.send_message(
-            chat_id=telegram_id,
-            text=text,
-            parse_mode=ParseMode.MARKDOWN,
-        )
+        await _send_message(telegram_id, text, ParseMode.MARKDOWN)
         logger.info("Correlation alert sent to %s: %s triggered", telegram_id, triggered_by)
         return True
-    except Exception as exc:
+    except TelegramAPIError as exc:
         logger.error("Correlation Telegram send error to %s: %s", telegram_id, exc)
         return False
 
 
-async def send_text(telegram_id: str, text: str) -> bool:
+async def send_text(telegram_id: int | str, text: str) -> bool:
     """Send a plain text Telegram message."""
-    bot = get_bot()
     try:
-        await bot.send_message(chat_id=telegram_id, text=text)
+        await _send_message(telegram_id, text)
         return True
-    except Exception as exc:
+    except TelegramAPIError as exc:
         logger.error("Telegram text error: %s", exc)
         return False
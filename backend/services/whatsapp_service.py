@@ -1,51 +1,111 @@
 """WhatsApp Cloud API (Meta Graph API) — alerts, interactive menus, bot interface."""
 
+import asyncio
 import hashlib
 import hmac
 import logging
+import random
+from functools import lru_cache
 
 import httpx
+import orjson
 
 from core.config import settings
 
 logger = logging.getLogger(__name__)
 
 GRAPH_URL = "https://graph.facebook.com/v19.0"
+SEND_ATTEMPTS = 3
+MAX_RETRY_DELAY = 10  # seconds
+_MESSAGES_URL = f"{GRAPH_URL}/{settings.WHATSAPP_PHONE_NUMBER_ID}/messages"
+
+# One pooled HTTP/2 client for every Graph API call (bot replies + alert fan-out)
+_client: httpx.AsyncClient | None = None
+
+
+def _get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            http2=True,
+            timeout=10,
+            # Bodies are pre-encoded with orjson and sent as content=; the token
+            # is fixed for the process (Settings is frozen), so it rides along too
+            headers={
+                "Authorization": f"Bearer {settings.WHATSAPP_ACCESS_TOKEN}",
+                "Content-Type": "application/json",
+            },
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=50, keepalive_expiry=60),
+        )
+    return _client
 
 
-def verify_whatsapp_signature(payload: bytes, signature: str) -> bool:
-    """Verify Meta webhook signature (HMAC SHA256, prefix 'sha256=')."""
-    expected = hmac.new(
-        settings.WHATSAPP_ACCESS_TOKEN.encode("utf-8"),
-        payload,
-        hashlib.sha256,
-    ).hexdigest()
-    received = signature.removeprefix("sha256=")
-    return hmac.compare_digest(expected, received)
+async def close_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
 
 
-async def _post(url: str, payload: dict) -> bool:
+# Keyed once; each webhook copies the state instead of re-deriving the key pads
+_SIGNATURE_HMAC = hmac.new(settings.WHATSAPP_ACCESS_TOKEN.encode("utf-8"), digestmod=hashlib.sha256)
+
+
+def verify_whatsapp_signature(payload: bytes, signature: str) -> bool:
+    """Verify Meta webhook signature (HMAC SHA256, prefix 'sha256=')."""
+    h = _SIGNATURE_HMAC.copy()
+    h.update(payload)
+    expected = h.digest()
+    # Compare raw 32-byte digests rather than hex strings
+    try:
+        received = bytes.fromhex(signature.removeprefix("sha256="))
+    except ValueError:
+        return False
+    return len(received) == len(expected) and hmac.compare_digest(expected, received)
+
+
+def _retry_delay(attempt: int, resp: httpx.Response | None = None) -> float:
+    if resp is not None:
+        try:
+            return min(float(resp.headers["Retry-After"]), MAX_RETRY_DELAY)
+        except (KeyError, ValueError):
+            pass
+    return min(2 ** attempt * random.uniform(0.5, 1.5), MAX_RETRY_DELAY)
+
+
+async def _send(payload: dict) -> httpx.Response:
+    """POST to the messages endpoint; 429/5xx and transport errors are retried with backoff."""
+    body = orjson.dumps(payload)
+    for attempt in range(SEND_ATTEMPTS - 1):
+        try:
+            resp = await _get_client().post(_MESSAGES_URL, content=body)
+        except httpx.TransportError as exc:
+            logger.warning("WhatsApp transport error (attempt %d): %s", attempt + 1, exc)
+            await asyncio.sleep(_retry_delay(attempt))
+            continue
+        if resp.status_code != 429 and resp.status_code < 500:
+            return resp.raise_for_status()
+        logger.warning("WhatsApp API %s (attempt %d) — retrying", resp.status_code, attempt + 1)
+        await asyncio.sleep(_retry_delay(attempt, resp))
+    resp = await _get_client().post(_MESSAGES_URL, content=body)
+    return resp.raise_for_status()
+
+
+async def _post(payload: dict) -> bool:
     try:
-        async with httpx.AsyncClient(timeout=10) as client:
-            resp = await client.post(
-                url,
-                json=payload,
-                headers={"Authorization": f"Bearer {settings.WHATSAPP_ACCESS_TOKEN}"},
-            )
-            resp.raise_for_status()
-            return True
+        await _send(payload)
+        return True
     except httpx.HTTPStatusError as exc:
         logger.error("WhatsApp API error: %s", exc.response.text)
         return False
-    except Exception as exc:
+    except httpx.HTTPError as exc:
         logger.error("WhatsApp send error: %s", exc)
         return False
 
 
 async def send_text_message(phone: str, text: str) -> bool:
     """Send a plain text message."""
-    url = f"{GRAPH_URL}/{settings.WHATSAPP_PHONE_NUMBER_ID}/messages"
-    return await _post(url, {
+    return await _post({
         "messaging_product": "whatsapp",
         "to": phone,
         "type": "text",
@@ -57,8 +117,7 @@ async def send_button_message(phone: str, body: str, buttons: list[tuple[str, st
     """Send interactive button message (max 3 buttons).
     buttons = [(id, label), ...]
     """
-    url = f"{GRAPH_URL}/{settings.WHATSAPP_PHONE_NUMBER_ID}/messages"
-    return await _post(url, {
+    return await _post({
         "messaging_product": "whatsapp",
         "to": phone,
         "type": "interactive",
@@ -84,8 +143,7 @@ async def send_list_message(
     """Send interactive list message.
     sections = [{"title": "...", "rows": [{"id": "...", "title": "...", "description": "..."}]}]
     """
-    url = f"{GRAPH_URL}/{settings.WHATSAPP_PHONE_NUMBER_ID}/messages"
-    return await _post(url, {
+    return await _post({
         "messaging_product": "whatsapp",
         "to": phone,
         "type": "interactive",
@@ -100,29 +158,18 @@ async def send_list_message(
     })
 
 
-async def send_alert_template(
-    phone: str,
+# Everything but "to" is shared by recipients of the same level, so it's built
+# once and reused (read-only) across the fan-out
+@lru_cache(maxsize=256)
+def _alert_template(
     symbol: str,
     alert_type: str,
     price: float,
     target: float,
     ai_summary: str,
-) -> bool:
-    """Send a pre-approved WhatsApp template message for an alert trigger.
-
-    Template name: 'market_alert'
-    Named parameters (Meta-approved):
-      {{symbol}}        = trading pair / ticker
-      {{alert_type}}    = touch / cross / near
-      {{current_price}} = current market price
-      {{target_level}}  = alert target price
-      {{ai_summary}}    = AI market context
-    """
-    url = f"{GRAPH_URL}/{settings.WHATSAPP_PHONE_NUMBER_ID}/messages"
-
-    payload = {
+) -> dict:
+    return {
         "messaging_product": "whatsapp",
-        "to": phone,
         "type": "template",
         "template": {
             "name": "market_alert",
@@ -142,19 +189,34 @@ async def send_alert_template(
         },
     }
 
+
+async def send_alert_template(
+    phone: str,
+    symbol: str,
+    alert_type: str,
+    price: float,
+    target: float,
+    ai_summary: str,
+) -> bool:
+    """Send a pre-approved WhatsApp template message for an alert trigger.
+
+    Template name: 'market_alert'
+    Named parameters (Meta-approved):
+      {{symbol}}        = trading pair / ticker
+      {{alert_type}}    = touch / cross / near
+      {{current_price}} = current market price
+      {{target_level}}  = alert target price
+      {{ai_summary}}    = AI market context
+    """
+    payload = {**_alert_template(symbol, alert_type, price, target, ai_summary), "to": phone}
+
     try:
-        async with httpx.AsyncClient(timeout=10) as client:
-            resp = await client.post(
-                url,
-                json=payload,
-                headers={"Authorization": f"Bearer {settings.WHATSAPP_ACCESS_TOKEN}"},
-            )
-            resp.raise_for_status()
-            logger.info("WhatsApp alert sent to %s for %s", phone, symbol)
-            return True
+        await _send(payload)
+        logger.info("WhatsApp alert sent to %s for %s", phone, symbol)
+        return True
     except httpx.HTTPStatusError as exc:
         logger.error("WhatsApp send failed %s: %s", phone, exc.response.text)
         return False
-    except Exception as exc:
+    except httpx.HTTPError as exc:
         logger.error("WhatsApp send error %s: %s", phone, exc)
         return False
@@ -1,72 +1,83 @@
-"""Background worker — polls FMP every 30 s and fires alert checks."""
+"""Background worker — polls FMP (every 30 s by default) and fires alert checks."""
 
 import asyncio
 import logging
 from typing import Any
 
-from supabase import create_client
-
-from core.config import settings
 from services.fmp import fetch_batch_quotes
-from services.alert_engine import check_alerts, check_correlation_alerts
+from services.alert_engine import (
+    active_alerts,
+    active_correlation_alerts,
+    check_alerts,
+    check_correlation_alerts,
+    quote_prices,
+)
 
 logger = logging.getLogger(__name__)
 
 POLL_INTERVAL = 30  # seconds
+FAST_POLL_INTERVAL = 10  # seconds — something moved at least FAST_MOVE_BPS last tick
+IDLE_POLL_INTERVAL = 120  # seconds — no watched price changed at all (e.g. FX weekend)
+FAST_MOVE_BPS = 10
 
 
-async def _get_active_symbols() -> list[str]:
+async def _get_active_symbols(correlation: list[dict[str, Any]]) -> list[str]:
     """Return all unique symbols needed by active regular AND correlation alerts."""
-    supabase = create_client(settings.SUPABASE_URL, settings.SUPABASE_SERVICE_KEY)
-    symbols: set[str] = set()
-
-    # Regular alerts
-    r = (
-        supabase.table("alerts")
-        .select("symbol")
-        .eq("is_active", True)
-        .is_("triggered_at", "null")
-        .execute()
-    )
-    for row in (r.data or []):
-        symbols.add(row["symbol"])
+    # Regular alerts — served from the engine's in-memory cache
+    symbols: set[str] = set(await active_alerts())
 
     # Correlation alerts — need both symbol1 and symbol2
-    rc = (
-        supabase.table("correlation_alerts")
-        .select("symbol1,symbol2")
-        .eq("is_active", True)
-        .is_("triggered_at", "null")
-        .execute()
-    )
-    for row in (rc.data or []):
+    for row in correlation:
         symbols.add(row["symbol1"])
         symbols.add(row["symbol2"])
 
     return list(symbols)
 
 
+def _next_interval(prices: dict[str, float], prev_prices: dict[str, float]) -> float:
+    """Poll faster while prices are moving, slower while they're frozen."""
+    moves = [
+        abs(price - prev_prices[sym]) / prev_prices[sym]
+        for sym, price in prices.items()
+        if sym in prev_prices
+    ]
+    if not moves:
+        return POLL_INTERVAL
+    biggest_bps = max(moves) * 10_000
+    if biggest_bps >= FAST_MOVE_BPS:
+        return FAST_POLL_INTERVAL
+    if biggest_bps == 0:
+        return IDLE_POLL_INTERVAL
+    return POLL_INTERVAL
+
+
 async def run_worker() -> None:
     """Main polling loop — runs for the lifetime of the FastAPI process."""
     logger.info("FMP worker started (interval=%ds)", POLL_INTERVAL)
 
-    prev_quotes: dict[str, dict[str, Any]] = {}
+    # Only prices carry over between ticks; each quote is cast to float once
+    prev_prices: dict[str, float] = {}
 
     while True:
+        interval = POLL_INTERVAL
         try:
-            symbols = await _get_active_symbols()
+            # One correlation fetch per tick feeds both the symbol list and the check
+            correlation = await active_correlation_alerts()
+            symbols = await _get_active_symbols(correlation)
 
             if symbols:
                 quotes = await fetch_batch_quotes(symbols)
                 if quotes:
-                    await check_alerts(quotes, prev_quotes)
-                    await check_correlation_alerts(quotes, prev_quotes)
-                    prev_quotes = {s: quotes[s] for s in quotes}
+                    prices = quote_prices(quotes)
+                    await check_alerts(prices, prev_prices)
+                    await check_correlation_alerts(correlation, prices, prev_prices)
+                    interval = _next_interval(prices, prev_prices)
+                    prev_prices = prices
             else:
+                # Stays at POLL_INTERVAL so a newly created alert is picked up promptly
                 logger.debug("No active alert symbols — skipping FMP call")
-                prev_quotes.clear()
 
         except Exception as exc:
             logger.error("Worker loop error: %s", exc, exc_info=True)
 
-        await asyncio.sleep(POLL_INTERVAL)
+        await asyncio.sleep(interval)
@@ -0,0 +1,32 @@
+-- Migration 007: WhatsApp bot bundle RPC
+-- Run in Supabase Dashboard → SQL Editor
+--
+-- Returns a linked profile with its active alerts and recent triggered
+-- alerts in one round trip, so menu taps in the WhatsApp bot don't need
+-- 2–3 sequential PostgREST calls.
+
+create or replace function public.wa_bundle(p_phone text, p_history_limit int default 10)
+returns jsonb language sql stable security definer set search_path = public as $$
+  select case when p.id is null then null else jsonb_build_object(
+    'profile', to_jsonb(p),
+    'alerts', coalesce((
+      select jsonb_agg(to_jsonb(a) order by a.created_at desc)
+      from public.alerts a
+      where a.user_id = p.id and a.triggered_at is null
+    ), '[]'::jsonb),
+    'history', coalesce((
+      select jsonb_agg(to_jsonb(h) order by h.triggered_at desc)
+      from (
+        select * from public.alerts
+        where user_id = p.id and triggered_at is not null
+        order by triggered_at desc
+        limit p_history_limit
+      ) h
+    ), '[]'::jsonb)
+  ) end
+  from (select 1) one
+  left join public.profiles p on p.whatsapp = p_phone;
+$$;
+
+-- Only the backend (service role) should call this
+revoke execute on function public.wa_bundle(text, int) from public, anon, authenticated;
@@ -0,0 +1,22 @@
+-- Migration 008: Link a WhatsApp number to an account in one call
+-- Run in Supabase Dashboard → SQL Editor
+--
+-- Links the number to the profile with the given email and returns the
+-- linked row. Only when that email exists is the number first detached from
+-- any other profile (the bot looks profiles up by phone and expects a single
+-- match) — a mistyped email leaves the current link untouched.
+
+create or replace function public.link_whatsapp(p_email text, p_phone text)
+returns setof public.profiles language sql security definer set search_path = public as $$
+  update public.profiles
+    set whatsapp = null
+    where whatsapp = p_phone and email <> p_email
+      and exists (select 1 from public.profiles where email = p_email);
+
+  update public.profiles
+    set whatsapp = p_phone
+    where email = p_email
+    returning *;
+$$;
+
+revoke execute on function public.link_whatsapp(text, text) from public, anon, authenticated;
@@ -0,0 +1,14 @@
+-- Migration 009: Mark a batch of alerts as triggered
+-- Run in Supabase Dashboard → SQL Editor
+--
+-- The worker passes the ids in the request body, so large batches don't hit
+-- URL length limits the way `?id=in.(...)` filters do.
+
+create or replace function public.mark_alerts_triggered(ids uuid[], fired_at timestamptz)
+returns void language sql security definer set search_path = public as $$
+  update public.alerts
+    set triggered_at = fired_at, is_active = false
+    where id = any(ids);
+$$;
+
+revoke execute on function public.mark_alerts_triggered(uuid[], timestamptz) from public, anon, authenticated;
@@ -0,0 +1,14 @@
+-- Migration 010: Mark a batch of correlation alerts as triggered
+-- Run in Supabase Dashboard → SQL Editor
+--
+-- ids[i] fired on syms[i]; one statement replaces the per-row updates.
+
+create or replace function public.mark_correlation_triggered(ids uuid[], syms text[], fired_at timestamptz)
+returns void language sql security definer set search_path = public as $$
+  update public.correlation_alerts c
+    set triggered_at = fired_at, is_active = false, triggered_by = t.sym
+    from unnest(ids, syms) as t(id, sym)
+    where c.id = t.id;
+$$;
+
+revoke execute on function public.mark_correlation_triggered(uuid[], text[], timestamptz) from public, anon, authenticated;
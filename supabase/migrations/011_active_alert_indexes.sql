@@ -0,0 +1,14 @@
+-- Migration 011: Partial indexes for the worker's active-alert scans
+-- Run in Supabase Dashboard → SQL Editor
+--
+-- Only untriggered, active rows are indexed, so the worker's queries touch a
+-- small slice instead of the full alert history. (reminders already has
+-- reminders_remind_at_sent from migration 005.)
+
+create index if not exists alerts_active_symbol_idx
+  on public.alerts (symbol)
+  where is_active and triggered_at is null;
+
+create index if not exists correlation_alerts_active_idx
+  on public.correlation_alerts (symbol1, symbol2)
+  where is_active and triggered_at is null;